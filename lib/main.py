@@ -61,6 +61,8 @@ def main():
         templates_path,
         opts.cluster,
     )
+    config.refresh_cache = opts.refresh
+    config.setup_after_launch = opts.setup
     config.verify_config(action)
 
     if action == "config":
@@ -18,9 +18,18 @@
 
 import json
 import subprocess
+import tempfile
 from os import path
+from azure.core.exceptions import ResourceNotFoundError
 from azure.identity import DefaultAzureCredential
 from azure.mgmt.compute import ComputeManagementClient
+from azure.mgmt.compute.models import (
+    VirtualMachineScaleSetVMInstanceRequiredIDs,
+)
+from azure.mgmt.network import NetworkManagementClient
+from concurrent.futures import ThreadPoolExecutor
+from .azureprovision import AzureProvisioner, nic_ips
+from .config.azurevalidationhelpers import VMSS_MAX_WORKERS, vmss_names
 from .existing import ExistingCluster
 
 
@@ -31,9 +40,35 @@ class VmssCluster(ExistingCluster):
         ExistingCluster.__init__(self, config)
 
     def launch(self):
+        self.launch_vmss()
+        if self.config.setup_after_launch:
+            self.config.reload_nodes()
+            self.setup()
+
+    def launch_vmss(self):
+        # creates (or resizes) the VMSS to numnodes instances and rewrites
+        # the hosts file and [nodes] in muchos.props
         config = self.config
         azure_config = config.ansible_host_vars()
         azure_config["vmss_name"] = config.cluster_name
+        if config.use_baked_image():
+            image_id = self.find_baked_image()
+            if image_id is not None:
+                print(
+                    "Using baked image '{0}'".format(
+                        config.baked_image_name()
+                    )
+                )
+                azure_config["azure_image_reference"] = "||||{0}|".format(
+                    image_id
+                )
+
+        if config.provisioner() == "native":
+            try:
+                AzureProvisioner(config, azure_config).provision()
+            finally:
+                self.invalidate_inventory()
+            return
 
         retcode = subprocess.call(
             [
@@ -43,6 +78,7 @@ class VmssCluster(ExistingCluster):
                 json.dumps(azure_config),
             ]
         )
+        self.invalidate_inventory()
         if retcode != 0:
             exit(
                 "ERROR - Command failed with return code of {0}".format(
@@ -50,22 +86,236 @@ class VmssCluster(ExistingCluster):
                 )
             )
 
-    def status(self):
+    def find_baked_image(self):
+        try:
+            return (
+                self.compute_client()
+                .images.get(
+                    self.config.get("azure", "resource_group"),
+                    self.config.baked_image_name(),
+                )
+                .id
+            )
+        except ResourceNotFoundError:
+            return None
+
+    def bake(self):
+        # creates a builder VM from azure_image_reference, installs the
+        # software of the cluster on it and captures it as a managed image
         config = self.config
-        azure_vars_dict = dict(config.items("azure"))
-        credential = DefaultAzureCredential()
-        compute_client = ComputeManagementClient(
-            credential, azure_vars_dict["azure_subscription_id"]
+        self.verify_bake()
+        name = config.baked_image_name()
+        if self.find_baked_image() is not None:
+            print(
+                "Image '{0}' was already baked for the software of {1} "
+                "cluster".format(name, config.cluster_name)
+            )
+            return
+
+        print("Baking image '{0}' from {1}".format(name, config.base_image()))
+        azure_config = config.ansible_host_vars()
+        azure_config["builder_name"] = config.cluster_name + "-bake-builder"
+        azure_config["image_name"] = name
+        azure_config["image_key"] = config.image_key()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            azure_config["builder_ip_path"] = path.join(tmp_dir, "builder_ip")
+            self.bake_step("builder", azure_config)
+            with open(azure_config["builder_ip_path"]) as ip_file:
+                builder_ip = ip_file.read().strip()
+        try:
+            self.provision_builder(builder_ip)
+            self.bake_step("image", azure_config)
+        finally:
+            self.bake_step("cleanup", azure_config)
+        print(
+            "Baked image '{0}'. Nodes of clusters with the same software are "
+            "launched from it".format(name)
         )
-        vmss_status = compute_client.virtual_machine_scale_sets.get(
-            azure_vars_dict["resource_group"], self.config.cluster_name
+
+    def bake_step(self, step, azure_config):
+        retcode = subprocess.call(
+            [
+                "ansible-playbook",
+                path.join(self.config.deploy_path, "ansible/azure_bake.yml"),
+                "--extra-vars",
+                json.dumps(dict(azure_config, bake_step=step)),
+            ]
         )
+        if retcode != 0:
+            exit(
+                "ERROR - Command failed with return code of {0}".format(
+                    retcode
+                )
+            )
+
+    def status(self):
+        nodes = self.config.nodes()
+        print("Nodes in {0} cluster:".format(self.config.cluster_name))
+        num_nodes = 0
+        for vm in self.iter_inventory(self.vmss_status):
+            print(
+                "  ",
+                vm["name"],
+                vm.get("vmss", ""),
+                vm.get("power_state", ""),
+                vm["provisioning_state"],
+                vm.get("private_ip", ""),
+                ",".join(nodes.get(vm["name"], [])),
+            )
+            num_nodes += 1
+        print(
+            "Found {0} nodes in {1} cluster".format(
+                num_nodes, self.config.cluster_name
+            )
+        )
+
+    def compute_client(self):
+        return ComputeManagementClient(
+            DefaultAzureCredential(),
+            self.config.get("azure", "azure_subscription_id"),
+        )
+
+    def network_client(self):
+        return NetworkManagementClient(
+            DefaultAzureCredential(),
+            self.config.get("azure", "azure_subscription_id"),
+        )
+
+    def vmss_status(self):
+        # The instances of each VMSS are listed with their instance views,
+        # and the NICs of each VMSS with their IP configurations, using one
+        # paged call each. The calls for all the VMSS are made concurrently,
+        # rather than one call per instance.
+        resource_group = self.config.get("azure", "resource_group")
+        compute = self.compute_client()
+        network = self.network_client()
+
+        def list_vms(vmss_name):
+            return self.vmss_vms(compute, vmss_name, expand="instanceView")
+
+        interfaces = network.network_interfaces
+        list_vmss_nics = (
+            interfaces.list_virtual_machine_scale_set_network_interfaces
+        )
+
+        def list_nics(vmss_name):
+            try:
+                return list(list_vmss_nics(resource_group, vmss_name))
+            except ResourceNotFoundError:
+                return []
+
+        names = vmss_names(self.config)
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(VMSS_MAX_WORKERS, 2 * len(names)))
+        ) as executor:
+            vms = executor.map(list_vms, names)
+            nics = executor.map(list_nics, names)
+            vms, nics = list(vms), list(nics)
+
+        for vmss_name, vmss_vms, vmss_nics in zip(names, vms, nics):
+            ips = nic_ips(vmss_nics)
+            for vm in vmss_vms:
+                yield {
+                    "name": vm.name.replace("_", "-"),
+                    "vmss": vmss_name,
+                    "power_state": VmssCluster.power_state(vm),
+                    "provisioning_state": vm.provisioning_state,
+                    "private_ip": ips.get(vm.id.lower(), ""),
+                }
+
+    def vmss_vms(self, compute, vmss_name, expand=None):
+        # lists the instances of the VMSS, of which there are none if the
+        # VMSS does not exist (yet)
+        try:
+            return list(
+                compute.virtual_machine_scale_set_vms.list(
+                    self.config.get("azure", "resource_group"),
+                    vmss_name,
+                    expand=expand,
+                )
+            )
+        except ResourceNotFoundError:
+            return []
+
+    @staticmethod
+    def power_state(vm):
+        # e.g. 'running' or 'deallocated', from the PowerState/* status of
+        # the instance view
+        statuses = vm.instance_view.statuses if vm.instance_view else None
+        for status in statuses or []:
+            if status.code.startswith("PowerState/"):
+                return status.code.split("/", 1)[1]
+        return "unknown"
+
+    def grow(self):
+        # the VMSS is grown to numnodes instances, after which azure.yml
+        # assigns the 'worker' service to the new nodes in [nodes]
+        self.launch_vmss()
+        self.config.reload_nodes()
+        super().grow()
+
+    def remove_nodes(self, hostnames):
+        # The instances of every VMSS are listed (concurrently) to find the
+        # VMSS and instance ID of each host, by the computer name of the
+        # instance or by its instance name with underscores replaced by
+        # dashes (as used in the hosts file). The instances are then deleted
+        # from each of their VMSS.
+        names = vmss_names(self.config)
+        compute = self.compute_client()
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(VMSS_MAX_WORKERS, len(names)))
+        ) as executor:
+            vms = list(
+                executor.map(lambda n: self.vmss_vms(compute, n), names)
+            )
+        instances = {}
+        for vmss_name, vmss_vms in zip(names, vms):
+            for vm in vmss_vms:
+                instance = (vmss_name, vm.instance_id)
+                instances[vm.name.replace("_", "-")] = instance
+                if vm.os_profile and vm.os_profile.computer_name:
+                    instances[vm.os_profile.computer_name] = instance
+
+        unmatched = [h for h in hostnames if h not in instances]
+        if unmatched:
+            exit(
+                "ERROR - Hosts {0} are not instances of any VMSS of {1} "
+                "cluster".format(
+                    ", ".join(unmatched), self.config.cluster_name
+                )
+            )
+        instance_ids = {}
+        for hostname in hostnames:
+            vmss_name, instance_id = instances[hostname]
+            instance_ids.setdefault(vmss_name, []).append(instance_id)
+
+        vmss = self.compute_client().virtual_machine_scale_sets
+        pollers = []
+        for vmss_name, ids in instance_ids.items():
+            print(
+                "Deleting instances {0} of VMSS {1}".format(
+                    ", ".join(ids), vmss_name
+                )
+            )
+            pollers.append(
+                vmss.begin_delete_instances(
+                    self.config.get("azure", "resource_group"),
+                    vmss_name,
+                    VirtualMachineScaleSetVMInstanceRequiredIDs(
+                        instance_ids=ids
+                    ),
+                )
+            )
+        # the deletes of the VMSS run at the same time
+        for poller in pollers:
+            poller.result()
+        self.invalidate_inventory()
         print(
-            "name:",
-            vmss_status.name,
-            "\nprovisioning_state:",
-            vmss_status.provisioning_state,
+            "Deleted {0} VMSS instances. Lower numnodes in muchos.props (or "
+            "the capacity of the VMSS in azure_multiple_vmss_vars.yml) to "
+            "match the new size of the cluster".format(len(hostnames))
         )
+        super().remove_nodes(hostnames)
 
     def terminate(self):
         config = self.config
@@ -94,6 +344,7 @@ class VmssCluster(ExistingCluster):
                     json.dumps(azure_config),
                 ]
             )
+            self.invalidate_inventory()
         else:
             print("Aborted termination")
 
@@ -0,0 +1,629 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Provisioning of Azure clusters using the asynchronous Azure SDK clients, as
+an alternative to the ansible/azure.yml playbook
+"""
+
+import asyncio
+import base64
+from contextlib import AsyncExitStack
+from os import makedirs, path
+
+TAGS = {"deployment_type": "muchos", "application": "accumulo"}
+
+# services assigned to the first nodes of the VMSS, in the same way as
+# ansible/roles/azure/tasks/create_vmss.yml. All other nodes are workers.
+LEADER_SERVICES = [
+    "namenode,resourcemanager,accumulomaster,zookeeper",
+    "metrics",
+]
+HA_LEADER_SERVICES = [
+    "namenode,resourcemanager,accumulomaster,zookeeper,journalnode,zkfc",
+    "zookeeper,metrics,journalnode,namenode,zkfc,accumulomaster,"
+    "resourcemanager",
+    "journalnode,zookeeper",
+]
+
+
+class Resource(object):
+    # An Azure resource, which is created by the create coroutine function
+    # once all the resources that it depends on were created. The function
+    # is called with the dict of the resources created so far (by name).
+    def __init__(self, name, create, depends_on=()):
+        self.name = name
+        self.create = create
+        self.depends_on = list(depends_on)
+
+
+async def create_all(resources):
+    # Creates the resources of the dependency graph, where each resource is
+    # created as soon as the resources that it depends on were, so that
+    # independent resources are created (and polled) concurrently. Returns
+    # the created resources by name.
+    names = set(r.name for r in resources)
+    for resource in resources:
+        for name in resource.depends_on:
+            if name not in names:
+                raise ValueError(
+                    "{0} depends on unknown resource {1}".format(
+                        resource.name, name
+                    )
+                )
+
+    created = {}
+    tasks = {}
+
+    async def create(resource):
+        await asyncio.gather(*(tasks[name] for name in resource.depends_on))
+        created[resource.name] = await resource.create(created)
+
+    for resource in resources:
+        tasks[resource.name] = asyncio.ensure_future(create(resource))
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    return created
+
+
+async def wait(begin):
+    # waits for the long running operation started by the begin_* coroutine
+    poller = await begin
+    return await poller.result()
+
+
+def image_reference(reference):
+    # converts 'offer|publisher|sku|version|id' to an ARM image reference
+    fields = (reference.split("|") + [""] * 5)[:5]
+    offer, publisher, sku, version, image_id = fields
+    if image_id:
+        return {"id": image_id}
+    return {
+        "offer": offer,
+        "publisher": publisher,
+        "sku": sku,
+        "version": version,
+    }
+
+
+def image_plan(plan):
+    # converts 'name|product|publisher' to an ARM plan, or None if no plan
+    # name is given
+    fields = (plan.split("|") + [""] * 3)[:3]
+    if not fields[0]:
+        return None
+    return dict(zip(["name", "product", "publisher"], fields))
+
+
+def custom_data(cloud_init_file):
+    if not cloud_init_file:
+        return None
+    with open(cloud_init_file, "rb") as f:
+        return base64.b64encode(f.read()).decode("ascii")
+
+
+def nic_ips(nics):
+    # Returns the private IP of the VMSS instances by their (lower case)
+    # resource ID, which is the first 11 parts of the resource ID of a NIC
+    ips = {}
+    for nic in nics:
+        vm_id = "/".join(nic.id.split("/")[0:11]).lower()
+        ips[vm_id] = nic.ip_configurations[0].private_ip_address
+    return ips
+
+
+def hostname_ips(instances, nics):
+    # Returns (hostname, private IP) of the VMSS instances, using the
+    # instance names with underscores replaced by dashes as hostnames
+    ips = nic_ips(nics)
+    return [
+        (instance.name.replace("_", "-"), ips[instance.id.lower()])
+        for instance in instances
+    ]
+
+
+def node_services(hostnames, proxy_host, hdfs_ha):
+    # Returns the (hostname, services) of [nodes] in muchos.props
+    nodes = []
+    if proxy_host:
+        nodes.append((proxy_host, "client"))
+    leaders = HA_LEADER_SERVICES if hdfs_ha else LEADER_SERVICES
+    for i, hostname in enumerate(hostnames):
+        nodes.append((hostname, leaders[i] if i < len(leaders) else "worker"))
+    return nodes
+
+
+def write_hosts_file(hosts_path, host_ips):
+    makedirs(path.dirname(hosts_path), exist_ok=True)
+    with open(hosts_path, "w") as hosts_file:
+        for hostname, ip in host_ips:
+            print("{0} {1}".format(hostname, ip), file=hosts_file)
+
+
+def write_nodes(config_path, nodes, proxy_hostname):
+    # Replaces [nodes] in muchos.props with the given nodes (as the last
+    # section of the file) and sets proxy_hostname
+    with open(config_path) as f:
+        lines = f.read().splitlines()
+
+    kept = []
+    in_nodes = False
+    for line in lines:
+        if line.strip().startswith("["):
+            in_nodes = line.strip() == "[nodes]"
+        if not in_nodes:
+            kept.append(line)
+
+    proxy_line = "proxy_hostname = {0}".format(proxy_hostname)
+    proxy_lines = [
+        i
+        for i, line in enumerate(kept)
+        if line.split("=")[0].strip() == "proxy_hostname"
+    ]
+    if proxy_lines:
+        kept[proxy_lines[-1]] = proxy_line
+    else:
+        kept.append(proxy_line)
+
+    while kept and not kept[-1].strip():
+        kept.pop()
+    kept += ["", "[nodes]", "#host0 = service"]
+    kept += ["{0} = {1}".format(h, services) for h, services in nodes]
+    with open(config_path, "w") as f:
+        f.write("\n".join(kept) + "\n")
+
+
+class AzureProvisioner(object):
+    # Creates the resource group, network, optional proxy VM and VMSS of a
+    # cluster and writes the hosts file and [nodes] of muchos.props, like
+    # ansible/azure.yml does. azure_config holds the same variables that
+    # are given to the playbook.
+    def __init__(self, config, azure_config):
+        self.config = config
+        self.vars = azure_config
+        self.resource_group = azure_config["resource_group"]
+        self.location = azure_config["location"]
+        self.vmss_name = azure_config["vmss_name"]
+        self.proxy_host = azure_config.get("azure_proxy_host")
+
+    def provision(self):
+        asyncio.run(self.provision_async())
+
+    async def provision_async(self):
+        # the asynchronous clients (and aiohttp, which they need) are only
+        # required when this provisioner is used
+        from azure.identity.aio import DefaultAzureCredential
+        from azure.mgmt.compute.aio import ComputeManagementClient
+        from azure.mgmt.network.aio import NetworkManagementClient
+        from azure.mgmt.resource.aio import ResourceManagementClient
+
+        subscription_id = self.vars["azure_subscription_id"]
+        async with AsyncExitStack() as stack:
+            credential = await stack.enter_async_context(
+                DefaultAzureCredential()
+            )
+            self.resources = await stack.enter_async_context(
+                ResourceManagementClient(credential, subscription_id)
+            )
+            self.network = await stack.enter_async_context(
+                NetworkManagementClient(credential, subscription_id)
+            )
+            self.compute = await stack.enter_async_context(
+                ComputeManagementClient(credential, subscription_id)
+            )
+
+            created = await create_all(self.resource_graph())
+            instances, nics = await asyncio.gather(
+                self.list_instances(), self.list_nics()
+            )
+
+        host_ips = hostname_ips(instances, nics)
+        hostnames = [hostname for hostname, ip in host_ips]
+        if self.proxy_host:
+            proxy_ip = created["proxy_ip"].ip_address
+            host_ips.insert(0, (self.proxy_host, proxy_ip))
+        write_hosts_file(self.config.hosts_path, host_ips)
+        write_nodes(
+            self.config.config_path,
+            node_services(hostnames, self.proxy_host, self.config.hdfs_ha()),
+            self.proxy_host or hostnames[0],
+        )
+        print(
+            "VMSS {0} has {1} nodes".format(self.vmss_name, len(hostnames))
+        )
+
+    def resource_graph(self):
+        graph = [
+            Resource("resource_group", self.create_resource_group),
+            Resource("vnet", self.create_vnet, ["resource_group"]),
+            Resource("subnet", self.create_subnet, ["vnet"]),
+            Resource("vmss", self.create_vmss, ["subnet"]),
+        ]
+        if self.proxy_host:
+            graph += [
+                Resource(
+                    "proxy_ip", self.create_proxy_ip, ["resource_group"]
+                ),
+                Resource(
+                    "proxy_nsg", self.create_proxy_nsg, ["resource_group"]
+                ),
+                Resource(
+                    "proxy_nic",
+                    self.create_proxy_nic,
+                    ["subnet", "proxy_ip", "proxy_nsg"],
+                ),
+                Resource("proxy_vm", self.create_proxy_vm, ["proxy_nic"]),
+            ]
+        return graph
+
+    async def get_or_create(self, get, create):
+        # Some resources are only created if they do not exist, as updating
+        # them would change properties that cannot change (or would remove
+        # subnets from the virtual network)
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            return await get()
+        except ResourceNotFoundError:
+            return await create()
+
+    async def create_resource_group(self, created):
+        print("Creating resource group {0}".format(self.resource_group))
+        return await self.resources.resource_groups.create_or_update(
+            self.resource_group, {"location": self.location, "tags": TAGS}
+        )
+
+    async def create_vnet(self, created):
+        name = self.vars["vnet"]
+        networks = self.network.virtual_networks
+
+        async def create():
+            print("Creating virtual network {0}".format(name))
+            return await wait(
+                networks.begin_create_or_update(
+                    self.resource_group,
+                    name,
+                    {
+                        "location": self.location,
+                        "addressSpace": {
+                            "addressPrefixes": [self.vars["vnet_cidr"]]
+                        },
+                        "tags": TAGS,
+                    },
+                )
+            )
+
+        return await self.get_or_create(
+            lambda: networks.get(self.resource_group, name), create
+        )
+
+    async def create_subnet(self, created):
+        name = self.vars["subnet"]
+        print("Creating subnet {0}".format(name))
+        return await wait(
+            self.network.subnets.begin_create_or_update(
+                self.resource_group,
+                self.vars["vnet"],
+                name,
+                {
+                    "addressPrefix": self.vars["subnet_cidr"],
+                    "serviceEndpoints": [
+                        {
+                            "service": "Microsoft.Storage",
+                            "locations": [self.location],
+                        }
+                    ],
+                },
+            )
+        )
+
+    def ssh_public_key(self):
+        with open(path.expanduser("~/.ssh/id_rsa.pub")) as key_file:
+            return key_file.read().strip()
+
+    def os_profile(self, user):
+        return {
+            "adminUsername": user,
+            "linuxConfiguration": {
+                "disablePasswordAuthentication": True,
+                "ssh": {
+                    "publicKeys": [
+                        {
+                            "path": "/home/{0}/.ssh/authorized_keys".format(
+                                user
+                            ),
+                            "keyData": self.ssh_public_key(),
+                        }
+                    ]
+                },
+            },
+        }
+
+    def os_disk(self, vm_sku):
+        capabilities = self.config.sku_capabilities(vm_sku)
+        os_disk = {
+            "createOption": "FromImage",
+            "caching": "ReadWrite",
+            "managedDisk": {
+                "storageAccountType": (
+                    "Premium_LRS"
+                    if capabilities.premium_io
+                    else "Standard_LRS"
+                )
+            },
+        }
+        if self.vars.get("os_disk_size_gb"):
+            os_disk["diskSizeGB"] = self.vars["os_disk_size_gb"]
+        return os_disk
+
+    async def create_vmss(self, created):
+        scale_sets = self.compute.virtual_machine_scale_sets
+        vm_sku = self.vars["vm_sku"]
+        numnodes = self.vars["numnodes"]
+        sku = {"name": vm_sku, "tier": "Standard", "capacity": numnodes}
+
+        async def resize():
+            await scale_sets.get(self.resource_group, self.vmss_name)
+            print(
+                "Updating VMSS {0} to {1} nodes".format(
+                    self.vmss_name, numnodes
+                )
+            )
+            return await wait(
+                scale_sets.begin_update(
+                    self.resource_group, self.vmss_name, {"sku": sku}
+                )
+            )
+
+        async def create():
+            print(
+                "Creating VMSS {0} with {1} nodes".format(
+                    self.vmss_name, numnodes
+                )
+            )
+            return await wait(
+                scale_sets.begin_create_or_update(
+                    self.resource_group,
+                    self.vmss_name,
+                    self.vmss_parameters(sku, created["subnet"].id),
+                )
+            )
+
+        return await self.get_or_create(resize, create)
+
+    def vmss_parameters(self, sku, subnet_id):
+        vm_sku = self.vars["vm_sku"]
+        os_profile = self.os_profile(self.config.cluster_user())
+        os_profile["computerNamePrefix"] = self.vmss_name
+        cloud_init = custom_data(self.vars.get("azure_image_cloud_init_file"))
+        if cloud_init:
+            os_profile["customData"] = cloud_init
+
+        vm_profile = {
+            "osProfile": os_profile,
+            "storageProfile": {
+                "imageReference": image_reference(
+                    self.vars["azure_image_reference"]
+                ),
+                "osDisk": self.os_disk(vm_sku),
+                "dataDisks": [
+                    {
+                        "lun": lun,
+                        "createOption": "Empty",
+                        "diskSizeGB": self.vars["disk_size_gb"],
+                        "caching": self.vars["data_disk_caching"],
+                        "managedDisk": {
+                            "storageAccountType": self.vars["data_disk_sku"]
+                        },
+                    }
+                    for lun in range(self.vars["data_disk_count"])
+                ],
+            },
+            "networkProfile": {
+                "networkInterfaceConfigurations": [
+                    {
+                        "name": self.vmss_name,
+                        "properties": {
+                            "primary": True,
+                            "enableAcceleratedNetworking": (
+                                self.config.sku_capabilities(
+                                    vm_sku
+                                ).accelerated_networking
+                            ),
+                            "ipConfigurations": [
+                                {
+                                    "name": self.vmss_name,
+                                    "properties": {
+                                        "subnet": {"id": subnet_id}
+                                    },
+                                }
+                            ],
+                        },
+                    }
+                ]
+            },
+        }
+        if self.vars.get("vmss_priority") == "Spot":
+            vm_profile["priority"] = "Spot"
+
+        properties = {
+            "orchestrationMode": "Uniform",
+            "upgradePolicy": {"mode": "Manual"},
+            "virtualMachineProfile": vm_profile,
+        }
+        if sku["capacity"] > 100:
+            properties["singlePlacementGroup"] = False
+
+        parameters = {
+            "location": self.location,
+            "sku": sku,
+            "properties": properties,
+        }
+        plan = image_plan(self.vars["azure_image_plan"])
+        if plan:
+            parameters["plan"] = plan
+        return parameters
+
+    async def create_proxy_ip(self, created):
+        name = self.proxy_host + "-ip"
+        print("Creating public IP address {0}".format(name))
+        return await wait(
+            self.network.public_ip_addresses.begin_create_or_update(
+                self.resource_group,
+                name,
+                {
+                    "location": self.location,
+                    # Basic public IP addresses can no longer be created
+                    "sku": {"name": "Standard"},
+                    "publicIPAllocationMethod": "Static",
+                },
+            )
+        )
+
+    async def create_proxy_nsg(self, created):
+        name = self.proxy_host + "-nsg"
+        print("Creating network security group {0}".format(name))
+        return await wait(
+            self.network.network_security_groups.begin_create_or_update(
+                self.resource_group,
+                name,
+                {
+                    "location": self.location,
+                    "securityRules": [
+                        {
+                            "name": "SSH",
+                            "properties": {
+                                "protocol": "Tcp",
+                                "sourcePortRange": "*",
+                                "destinationPortRange": "22",
+                                "sourceAddressPrefix": "*",
+                                "destinationAddressPrefix": "*",
+                                "access": "Allow",
+                                "priority": 1001,
+                                "direction": "Inbound",
+                            },
+                        }
+                    ],
+                },
+            )
+        )
+
+    async def create_proxy_nic(self, created):
+        name = self.proxy_host + "-nic"
+        vm_sku = self.vars["azure_proxy_host_vm_sku"]
+        print("Creating network interface {0}".format(name))
+        return await wait(
+            self.network.network_interfaces.begin_create_or_update(
+                self.resource_group,
+                name,
+                {
+                    "location": self.location,
+                    "ipConfigurations": [
+                        {
+                            "name": "default",
+                            "properties": {
+                                "primary": True,
+                                "subnet": {"id": created["subnet"].id},
+                                "publicIPAddress": {
+                                    "id": created["proxy_ip"].id
+                                },
+                            },
+                        }
+                    ],
+                    "networkSecurityGroup": {"id": created["proxy_nsg"].id},
+                    "enableAcceleratedNetworking": (
+                        self.config.sku_capabilities(
+                            vm_sku
+                        ).accelerated_networking
+                    ),
+                },
+            )
+        )
+
+    async def create_proxy_vm(self, created):
+        name = self.proxy_host
+        machines = self.compute.virtual_machines
+        vm_sku = self.vars["azure_proxy_host_vm_sku"]
+
+        async def create():
+            print("Creating proxy VM {0}".format(name))
+            os_profile = self.os_profile(self.config.cluster_user())
+            os_profile["computerName"] = name
+            cloud_init = custom_data(
+                self.vars.get("azure_proxy_image_cloud_init_file")
+            )
+            if cloud_init:
+                os_profile["customData"] = cloud_init
+            parameters = {
+                "location": self.location,
+                "hardwareProfile": {"vmSize": vm_sku},
+                "osProfile": os_profile,
+                "storageProfile": {
+                    "imageReference": image_reference(
+                        self.vars["azure_proxy_image_reference"]
+                    ),
+                    "osDisk": self.os_disk(vm_sku),
+                    "dataDisks": [
+                        {
+                            "lun": 0,
+                            "createOption": "Empty",
+                            "diskSizeGB": 64,
+                            "managedDisk": {
+                                "storageAccountType": self.vars[
+                                    "data_disk_sku"
+                                ]
+                            },
+                        }
+                    ],
+                },
+                "networkProfile": {
+                    "networkInterfaces": [{"id": created["proxy_nic"].id}]
+                },
+            }
+            plan = image_plan(self.vars["azure_proxy_image_plan"])
+            if plan:
+                parameters["plan"] = plan
+            return await wait(
+                machines.begin_create_or_update(
+                    self.resource_group, name, parameters
+                )
+            )
+
+        return await self.get_or_create(
+            lambda: machines.get(self.resource_group, name), create
+        )
+
+    async def list_instances(self):
+        vms = self.compute.virtual_machine_scale_set_vms
+        return [
+            vm async for vm in vms.list(self.resource_group, self.vmss_name)
+        ]
+
+    async def list_nics(self):
+        interfaces = self.network.network_interfaces
+        return [
+            nic
+            async for nic in (
+                interfaces.list_virtual_machine_scale_set_network_interfaces(
+                    self.resource_group, self.vmss_name
+                )
+            )
+        ]
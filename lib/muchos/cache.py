@@ -0,0 +1,64 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+On-disk cache of values looked up from cloud APIs
+"""
+
+import json
+import os
+import time
+from os import path
+
+
+class FileCache(object):
+    # Each key is stored as a JSON file in cache_dir, along with the time
+    # at which it was written. Values must be JSON serializable, although
+    # values such as datetimes are stored as strings.
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def path(self, key):
+        return path.join(self.cache_dir, key + ".json")
+
+    def get(self, key, ttl):
+        # returns None if the key is missing, unreadable or older than
+        # ttl seconds. A ttl of None never expires the value.
+        try:
+            with open(self.path(key), "r") as cache_file:
+                entry = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+        if ttl is not None and time.time() - entry["time"] > ttl:
+            return None
+        return entry["value"]
+
+    def put(self, key, value):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # write to a temp file first, so that readers never see a partial file
+        tmp_path = "{0}.{1}.tmp".format(self.path(key), os.getpid())
+        with open(tmp_path, "w") as cache_file:
+            json.dump(
+                {"time": time.time(), "value": value}, cache_file, default=str
+            )
+        os.replace(tmp_path, self.path(key))
+
+    def invalidate(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,101 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Generation of cloud-init user data that sets up nodes while they boot
+"""
+
+import json
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+# packages installed by the common role that are available without EPEL
+BASE_PACKAGES = [
+    "vim",
+    "bash-completion",
+    "git",
+    "wget",
+    "gcc-c++",
+    "screen",
+    "patch",
+]
+
+# kernel settings applied by roles/common/tasks/os.yml on EC2
+SYSCTL_SETTINGS = [
+    ("vm.swappiness", 0),
+    ("vm.min_free_kbytes", 1000000),
+    ("vm.zone_reclaim_mode", 1),
+    ("net.core.somaxconn", 2048),
+]
+
+# mount options used by roles/common/tasks/ec2.yml, so that it finds the
+# mounts created by cloud-init unchanged
+MOUNT_OPTIONS = "defaults,nofail,noatime,nodiratime,comment=cloudconfig"
+
+
+def cloud_config(devices, mounts, fstype, force_format, owner, packages):
+    # Returns a cloud-config document that formats and mounts the devices,
+    # applies the kernel settings and installs the packages. As YAML is a
+    # superset of JSON, the document is written as JSON.
+    config = {
+        "fs_setup": [
+            {
+                "device": device,
+                "filesystem": fstype,
+                "overwrite": force_format == "yes",
+            }
+            for device in devices
+        ],
+        # these replace the default mount of the first ephemeral device
+        # on /mnt, as cloud-init resolves ephemeral0 to the same device
+        "mounts": [
+            [device, mount, "auto", MOUNT_OPTIONS, "0", "2"]
+            for device, mount in zip(devices, mounts)
+        ],
+        "write_files": [
+            {
+                "path": "/etc/sysctl.d/99-muchos.conf",
+                "content": "".join(
+                    "{0} = {1}\n".format(name, value)
+                    for name, value in SYSCTL_SETTINGS
+                ),
+            }
+        ],
+        "packages": list(packages),
+        "runcmd": [["sysctl", "--system"]]
+        + [["mkdir", "-p", mount] for mount in mounts]
+        + [["chown", owner, mount] for mount in mounts],
+    }
+    return "#cloud-config\n" + json.dumps(config, indent=2) + "\n"
+
+
+def combine(cloud_config_text, user_data=None):
+    # Returns the cloud-config as user data. If the user supplied their own
+    # user data, both are combined into a MIME multipart document, which
+    # cloud-init processes part by part.
+    if user_data is None:
+        return cloud_config_text
+    message = MIMEMultipart()
+    message.attach(MIMEText(cloud_config_text, "cloud-config"))
+    if user_data.startswith("#cloud-config"):
+        subtype = "cloud-config"
+    elif user_data.startswith("#!"):
+        subtype = "x-shellscript"
+    else:
+        subtype = "plain"
+    message.attach(MIMEText(user_data, subtype))
+    return message.as_string()
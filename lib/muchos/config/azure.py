@@ -23,6 +23,35 @@ from yaml import load, FullLoader
 from .azurevalidations import validate_azure_configs
 
 
+class VmSkuCapabilities(object):
+    # The capabilities of a VM SKU that Muchos checks. Azure reports all
+    # capabilities as strings, which are converted once here.
+    def __init__(
+        self,
+        accelerated_networking=False,
+        premium_io=False,
+        low_priority=False,
+        max_data_disks=0,
+    ):
+        self.accelerated_networking = accelerated_networking
+        self.premium_io = premium_io
+        self.low_priority = low_priority
+        self.max_data_disks = max_data_disks
+
+    @staticmethod
+    def from_sku(sku):
+        capabilities = {c.name: c.value for c in sku.capabilities}
+        return VmSkuCapabilities(
+            capabilities.get("AcceleratedNetworkingEnabled") == "True",
+            capabilities.get("PremiumIO") == "True",
+            capabilities.get("LowPriorityCapable") == "True",
+            int(capabilities.get("MaxDataDiskCount", 0)),
+        )
+
+
+_UNKNOWN_SKU = VmSkuCapabilities()
+
+
 class AzureDeployConfig(BaseConfig):
     def __init__(
         self,
@@ -41,6 +70,8 @@ class AzureDeployConfig(BaseConfig):
             templates_path,
             cluster_name,
         )
+        # set by validate_azure_configs
+        self.vm_skus_for_location = []
 
         # load azure_multiple_vmss_vars.yml
         if self.use_multiple_vmss():
@@ -75,7 +106,12 @@ class AzureDeployConfig(BaseConfig):
         pass
 
     def node_type_map(self):
-        return {}
+        # the data disks of all nodes are the same, only their layout can
+        # differ between node types
+        return {
+            node_type: {"layout": self.data_layout(node_type)}
+            for node_type in ["default", "worker"]
+        }
 
     def mount_root(self):
         return self.get("azure", "mount_root")
@@ -129,6 +165,10 @@ class AzureDeployConfig(BaseConfig):
             # in this case those are NVME temp disks
             num_disks = nvme_vm_disk_map[curr_vm_sku]
 
+        # Striped data disks are assembled into an array on a single mount
+        if self.data_layout(nodeType) == "striped" and num_disks > 1:
+            num_disks = 1
+
         # Persistent data disks attached to VMs
         range_var = num_disks + 1
         for diskNum in range(1, range_var):
@@ -206,6 +246,9 @@ class AzureDeployConfig(BaseConfig):
     def azure_image_reference(self):
         return self.get("azure", "azure_image_reference")
 
+    def base_image(self):
+        return self.azure_image_reference()
+
     @ansible_host_var
     @default("|||")
     def azure_image_plan(self):
@@ -381,6 +424,18 @@ class AzureDeployConfig(BaseConfig):
     def location(self):
         return self.get("azure", "location")
 
+    @default(86400)
+    def sku_cache_ttl(self):
+        # seconds that the VM SKUs of the location are cached in conf/cache
+        return self.getint("azure", "sku_cache_ttl")
+
+    @default("ansible")
+    @is_valid(is_in(["ansible", "native"]))
+    def provisioner(self):
+        # 'native' creates the resources of launch using the asynchronous
+        # Azure SDK clients, instead of the ansible/azure.yml playbook
+        return self.get("azure", "provisioner")
+
     @ansible_host_var
     @default("")
     def azure_proxy_host(self):
@@ -402,82 +457,49 @@ class AzureDeployConfig(BaseConfig):
     def data_disk_sku(self):
         return self.get("azure", "data_disk_sku")
 
+    @property
+    def vm_skus_for_location(self):
+        return self._vm_skus_for_location
+
+    @vm_skus_for_location.setter
+    def vm_skus_for_location(self, skus):
+        # the capabilities of the SKUs are indexed by name once, so that
+        # checking a SKU does not need to walk the whole list of SKUs
+        self._vm_skus_for_location = skus
+        self.sku_index = {s.name: VmSkuCapabilities.from_sku(s) for s in skus}
+
+    def sku_capabilities(self, sku):
+        # an unknown SKU has none of the capabilities
+        return self.sku_index.get(sku, _UNKNOWN_SKU)
+
+    def is_known_sku(self, sku):
+        return sku in self.sku_index
+
     @ansible_host_var
     def accnet_capable_skus(self):
-        return list(
-            map(
-                lambda r: r.name,
-                filter(
-                    lambda s: len(
-                        list(
-                            filter(
-                                lambda c: c.name
-                                == "AcceleratedNetworkingEnabled"
-                                and c.value == "True",
-                                s.capabilities,
-                            )
-                        )
-                    )
-                    > 0,
-                    self.vm_skus_for_location,
-                ),
-            )
-        )
+        return [
+            name
+            for name, capabilities in self.sku_index.items()
+            if capabilities.accelerated_networking
+        ]
 
     @ansible_host_var
     def premiumio_capable_skus(self):
-        return list(
-            map(
-                lambda r: r.name,
-                filter(
-                    lambda s: len(
-                        list(
-                            filter(
-                                lambda c: c.name == "PremiumIO"
-                                and c.value == "True",
-                                s.capabilities,
-                            )
-                        )
-                    )
-                    > 0,
-                    self.vm_skus_for_location,
-                ),
-            )
-        )
+        return [
+            name
+            for name, capabilities in self.sku_index.items()
+            if capabilities.premium_io
+        ]
 
     def spot_capable_skus(self):
-        return list(
-            map(
-                lambda r: r.name,
-                filter(
-                    lambda s: len(
-                        list(
-                            filter(
-                                lambda c: c.name == "LowPriorityCapable"
-                                and c.value == "True",
-                                s.capabilities,
-                            )
-                        )
-                    )
-                    > 0,
-                    self.vm_skus_for_location,
-                ),
-            )
-        )
+        return [
+            name
+            for name, capabilities in self.sku_index.items()
+            if capabilities.low_priority
+        ]
 
     def max_data_disks_for_skus(self):
-        n = list(map(lambda r: r.name, self.vm_skus_for_location))
-        d = list(
-            map(
-                lambda s: int(
-                    next(
-                        filter(
-                            lambda c: c.name == "MaxDataDiskCount",
-                            s.capabilities,
-                        )
-                    ).value
-                ),
-                self.vm_skus_for_location,
-            )
-        )
-        return dict(zip(n, d))
+        return {
+            name: capabilities.max_data_disks
+            for name, capabilities in self.sku_index.items()
+        }
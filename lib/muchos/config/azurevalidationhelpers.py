@@ -15,38 +15,57 @@
 # limitations under the License.
 #
 
+from concurrent.futures import ThreadPoolExecutor
 
-def vmss_status_succeeded_if_exists(config, client):
-    multi_vmss = config.getboolean("azure", "use_multiple_vmss")
-    resource_group = config.get("azure", "resource_group")
-    if not multi_vmss:
-        try:
-            vmss = client.virtual_machine_scale_sets.get(
-                resource_group_name=resource_group,
-                vm_scale_set_name=config.cluster_name,
-            )
-        except:  # noqa
-            return True
-        else:
-            return vmss.provisioning_state == "Succeeded"
-    else:
+# number of VMSS that are looked up from Azure concurrently
+VMSS_MAX_WORKERS = 8
+
+
+def vmss_names(config):
+    if not config.use_multiple_vmss():
+        return [config.cluster_name]
+    return [
+        "{}-{}".format(config.cluster_name, vmss_config.get("name_suffix", ""))
         for vmss_config in config.azure_multiple_vmss_vars.get(
             "vars_list", []
-        ):
-            cluster_name = "{}-{}".format(
-                config.cluster_name, vmss_config.get("name_suffix", "")
-            )
+        )
+    ]
+
+
+def vmss_provisioning_states(config, client):
+    # Returns the provisioning state of each VMSS of the cluster, or None if
+    # it does not exist. The VMSS are looked up concurrently, once for all
+    # the validations that need them. The synchronous client is used from a
+    # thread pool, as the validations run for every action and should not
+    # need aiohttp, which only the native provisioner requires.
+    if getattr(config, "vmss_states", None) is None:
+        resource_group = config.get("azure", "resource_group")
+
+        def provisioning_state(vmss_name):
             try:
                 vmss = client.virtual_machine_scale_sets.get(
                     resource_group_name=resource_group,
-                    vm_scale_set_name=cluster_name,
+                    vm_scale_set_name=vmss_name,
                 )
             except:  # noqa
-                pass
-            else:
-                if vmss.provisioning_state != "Succeeded":
-                    return False
-        return True
+                return None
+            return vmss.provisioning_state
+
+        names = vmss_names(config)
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(VMSS_MAX_WORKERS, len(names)))
+        ) as executor:
+            config.vmss_states = dict(
+                zip(names, executor.map(provisioning_state, names))
+            )
+    return config.vmss_states
+
+
+def vmss_status_succeeded_if_exists(config, client):
+    return all(
+        state is None or state == "Succeeded"
+        for state in vmss_provisioning_states(config, client).values()
+    )
 
 
 def validate_disk_count(
@@ -124,30 +143,7 @@ def vmss_cluster_has_appropriate_data_disk_count(config, client):
 
 
 def vmss_exists(config, client):
-    multi_vmss = config.getboolean("azure", "use_multiple_vmss")
-    resource_group = config.get("azure", "resource_group")
-    if not multi_vmss:
-        try:
-            _ = client.virtual_machine_scale_sets.get(
-                resource_group_name=resource_group,
-                vm_scale_set_name=config.cluster_name,
-            )
-        except:  # noqa
-            return False
-        else:
-            return True
-    else:
-        for vmss_config in config.azure_multiple_vmss_vars.get(
-            "vars_list", []
-        ):
-            cluster_name = "{}-{}".format(
-                config.cluster_name, vmss_config.get("name_suffix", "")
-            )
-            try:
-                _ = client.virtual_machine_scale_sets.get(
-                    resource_group_name=resource_group,
-                    vm_scale_set_name=cluster_name,
-                )
-            except:  # noqa
-                return False
-        return True
+    return all(
+        state is not None
+        for state in vmss_provisioning_states(config, client).values()
+    )
@@ -21,31 +21,29 @@ from .azurevalidationhelpers import (
     vmss_cluster_has_appropriate_data_disk_count,
     vmss_exists,
 )
+from types import SimpleNamespace
 from azure.mgmt.compute import ComputeManagementClient
 from azure.identity import DefaultAzureCredential
+from ..cache import FileCache
+
+# we have to use a specific API version to list the VM SKU resources of a
+# location, as this resource_skus list operation is not allowed in any other
+# API versions which are available with the version of Azure SDK that ships
+# with Ansible for Azure
+SKU_API_VERSION = "2017-09-01"
+
+# actions that create or set up VMs, and so look up the VM SKUs from Azure if
+# they are not cached (or --refresh is given) and always check the VM SKUs.
+# Other actions only use SKUs that were cached before.
+SKU_LOOKUP_ACTIONS = ["launch", "setup", "grow", "bake"]
 
 
 def validate_azure_configs(config, action):
     credential = DefaultAzureCredential()
 
-    # get VM SKU resources for this location. we have to use
-    # a specific API version to do this as this resource_skus
-    # list operation is not allowed in any other API versions
-    # which are available with the version of Azure SDK
-    # that ships with Ansible for Azure
-    config.client = ComputeManagementClient(
-        credential,
-        subscription_id=config.azure_subscription_id(),
-        api_version="2017-09-01",
-    )
-
-    config.vm_skus_for_location = list(
-        filter(
-            lambda s: s.resource_type == "virtualMachines"
-            and config.location() in s.locations,
-            config.client.resource_skus.list(),
-        )
-    )
+    config.vm_skus_for_location = load_vm_skus(config, credential, action)
+    # looked up (concurrently) by the first validation that checks the VMSS
+    config.vmss_states = None
 
     # switch to 2018-06-01 API which has support for other operations
     # including VMSS checks
@@ -60,6 +58,10 @@ def validate_azure_configs(config, action):
         if action in AZURE_VALIDATIONS
         else []
     )
+    if action in SKU_LOOKUP_ACTIONS or (
+        validations and config.vm_skus_for_location
+    ):
+        validations += AZURE_VALIDATIONS["skus"]
     return list(
         filter(
             lambda r: isinstance(r, str),
@@ -68,6 +70,55 @@ def validate_azure_configs(config, action):
     )
 
 
+def load_vm_skus(config, credential, action):
+    # Returns the VM SKUs of the location, from the cache in conf/cache if
+    # possible. As listing them goes through every SKU of the subscription,
+    # only the name and capabilities of the SKUs of the location are kept.
+    cache = FileCache(config.cache_dir())
+    key = sku_cache_key(config)
+    lookup = action in SKU_LOOKUP_ACTIONS
+    if not (lookup and config.refresh_cache):
+        skus = cache.get(key, config.sku_cache_ttl() if lookup else None)
+        if skus is not None:
+            return [sku_from_dict(d) for d in skus]
+    if not lookup:
+        return []
+
+    client = ComputeManagementClient(
+        credential,
+        subscription_id=config.azure_subscription_id(),
+        api_version=SKU_API_VERSION,
+    )
+    skus = [
+        {
+            "name": s.name,
+            "capabilities": [[c.name, c.value] for c in s.capabilities or []],
+        }
+        for s in client.resource_skus.list()
+        if s.resource_type == "virtualMachines"
+        and config.location() in s.locations
+    ]
+    cache.put(key, skus)
+    return [sku_from_dict(d) for d in skus]
+
+
+def sku_cache_key(config):
+    return "azure-skus-{0}-{1}-{2}".format(
+        config.azure_subscription_id(), config.location(), SKU_API_VERSION
+    )
+
+
+def sku_from_dict(d):
+    # has the same name and capabilities attributes as the SDK's ResourceSku
+    return SimpleNamespace(
+        name=d["name"],
+        capabilities=[
+            SimpleNamespace(name=name, value=value)
+            for name, value in d["capabilities"]
+        ],
+    )
+
+
 AZURE_VALIDATIONS = {
     "common": [
         # if VMSS instances are pending upgrade to latest version
@@ -80,18 +131,73 @@ AZURE_VALIDATIONS = {
         # considering temp disk usage etc.
         ConfigValidator(vmss_cluster_has_appropriate_data_disk_count, None),
         ConfigValidator(lambda config, client: not config.use_multiple_vmss()),
+        # data_disk_sku in
+        # ['Standard_LRS', 'StandardSSD_LRS', Premium_LRS']
+        ConfigValidator(
+            lambda config, client: config.data_disk_sku()
+            in ["Standard_LRS", "StandardSSD_LRS", "Premium_LRS"],
+            "data_disk_sku must be "
+            "one of Standard_LRS, StandardSSD_LRS, or Premium_LRS",
+        ),
+        ConfigValidator(
+            lambda config, client: not config.use_multiple_vmss()
+            or all(
+                [
+                    vmss.get("data_disk_sku")
+                    in ["Standard_LRS", "StandardSSD_LRS", "Premium_LRS"]
+                    for vmss in config.azure_multiple_vmss_vars.get(
+                        "vars_list", []
+                    )
+                ]
+            ),
+            "when use_multiple_vmss == True, the data_disk_sku specified for "
+            "the VMSS must be one of Standard_LRS, StandardSSD_LRS "
+            "or Premium_LRS",
+        ),
+        # in the multiple VMSS case, a azure_multiple_vmss_vars.yml file
+        # must be provided
+        ConfigValidator(
+            lambda config, client: not config.use_multiple_vmss()
+            or hasattr(config, "azure_multiple_vmss_vars"),
+            "in the multiple VMSS case, an azure_multiple_vmss_vars.yml"
+            " file must be provided",
+        ),
+        # in the multiple VMSS case, each name suffix should be unique
+        ConfigValidator(
+            lambda config, client: not config.use_multiple_vmss()
+            or len(config.azure_multiple_vmss_vars.get("vars_list", []))
+            == len(
+                set(
+                    [
+                        v.get("name_suffix")
+                        for v in config.azure_multiple_vmss_vars.get(
+                            "vars_list", []
+                        )
+                    ]
+                )
+            ),
+            "in the multiple VMSS case, each name suffix of a VMSS"
+            " must be unique",
+        ),
+        # ADLS Gen2 is only supported if Accumulo 2.x is used
+        ConfigValidator(
+            lambda config, client: not config.use_adlsg2()
+            or config.version("accumulo").split(".")[0] == "2",
+            "ADLS Gen2 support requires Accumulo 2.x",
+        ),
+    ],
+    # checks of the VM SKUs, which are skipped if the SKUs are not known
+    "skus": [
         # the VM SKU specified is not a valid Azure VM SKU
         ConfigValidator(
-            lambda config, client: config.vm_sku()
-            in {s.name: s for s in config.vm_skus_for_location},
+            lambda config, client: config.is_known_sku(config.vm_sku()),
             "azure.vm_sku must be a valid VM SKU for the selected location",
         ),
         ConfigValidator(
             lambda config, client: not config.use_multiple_vmss()
             or all(
                 [
-                    vmss.get("sku")
-                    in {s.name: s for s in config.vm_skus_for_location}
+                    config.is_known_sku(vmss.get("sku"))
                     for vmss in config.azure_multiple_vmss_vars.get(
                         "vars_list", []
                     )
@@ -106,7 +212,7 @@ AZURE_VALIDATIONS = {
                 "azure", "use_multiple_vmss"
             )
             or not config.vmss_priority() == "Spot"
-            or config.vm_sku() in config.spot_capable_skus(),
+            or config.sku_capabilities(config.vm_sku()).low_priority,
             "azure.vm_sku must be an Azure Spot (low priority) capable VM SKU",
         ),
         ConfigValidator(
@@ -116,7 +222,7 @@ AZURE_VALIDATIONS = {
             or all(
                 [
                     (
-                        vmss.get("sku") in config.spot_capable_skus()
+                        config.sku_capabilities(vmss.get("sku")).low_priority
                         if vmss.get("vmss_priority") == "Low"
                         else True
                     )
@@ -128,34 +234,11 @@ AZURE_VALIDATIONS = {
             "when use_multiple_vmss == True, any VMSS set to use Azure Spot "
             "(low priority) must use an Azure Spot-capable VM SKU",
         ),
-        # data_disk_sku in
-        # ['Standard_LRS', 'StandardSSD_LRS', Premium_LRS']
-        ConfigValidator(
-            lambda config, client: config.data_disk_sku()
-            in ["Standard_LRS", "StandardSSD_LRS", "Premium_LRS"],
-            "data_disk_sku must be "
-            "one of Standard_LRS, StandardSSD_LRS, or Premium_LRS",
-        ),
-        ConfigValidator(
-            lambda config, client: not config.use_multiple_vmss()
-            or all(
-                [
-                    vmss.get("data_disk_sku")
-                    in ["Standard_LRS", "StandardSSD_LRS", "Premium_LRS"]
-                    for vmss in config.azure_multiple_vmss_vars.get(
-                        "vars_list", []
-                    )
-                ]
-            ),
-            "when use_multiple_vmss == True, the data_disk_sku specified for "
-            "the VMSS must be one of Standard_LRS, StandardSSD_LRS "
-            "or Premium_LRS",
-        ),
         # Cannot specify Premium managed disks if VMSS SKU is / are not capable
         ConfigValidator(
             lambda config, client: config.use_multiple_vmss()
             or not config.data_disk_sku() == "Premium_LRS"
-            or config.vm_sku() in config.premiumio_capable_skus(),
+            or config.sku_capabilities(config.vm_sku()).premium_io,
             "azure.vm_sku must be Premium I/O capable VM SKU "
             "in order to use Premium Managed Disks",
         ),
@@ -164,7 +247,7 @@ AZURE_VALIDATIONS = {
             or all(
                 [
                     (
-                        vmss.get("sku") in config.premiumio_capable_skus()
+                        config.sku_capabilities(vmss.get("sku")).premium_io
                         if vmss.get("data_disk_sku") == "Premium_LRS"
                         else True
                     )
@@ -180,7 +263,7 @@ AZURE_VALIDATIONS = {
         ConfigValidator(
             lambda config, client: config.use_multiple_vmss()
             or config.data_disk_count()
-            <= config.max_data_disks_for_skus().get(config.vm_sku(), 0),
+            <= config.sku_capabilities(config.vm_sku()).max_data_disks,
             "Number of data disks specified exceeds allowed limit for VM SKU",
         ),
         ConfigValidator(
@@ -188,7 +271,7 @@ AZURE_VALIDATIONS = {
             or all(
                 [
                     vmss.get("data_disk_count")
-                    <= config.max_data_disks_for_skus().get(config.vm_sku(), 0)
+                    <= config.sku_capabilities(vmss.get("sku")).max_data_disks
                     for vmss in config.azure_multiple_vmss_vars.get(
                         "vars_list", []
                     )
@@ -197,37 +280,6 @@ AZURE_VALIDATIONS = {
             "when use_multiple_vmss == True, no VMSS can specify number of "
             "data disks exceeding the allowed limit for the respective VM SKU",
         ),
-        # in the multiple VMSS case, a azure_multiple_vmss_vars.yml file
-        # must be provided
-        ConfigValidator(
-            lambda config, client: not config.use_multiple_vmss()
-            or hasattr(config, "azure_multiple_vmss_vars"),
-            "in the multiple VMSS case, an azure_multiple_vmss_vars.yml"
-            " file must be provided",
-        ),
-        # in the multiple VMSS case, each name suffix should be unique
-        ConfigValidator(
-            lambda config, client: not config.use_multiple_vmss()
-            or len(config.azure_multiple_vmss_vars.get("vars_list", []))
-            == len(
-                set(
-                    [
-                        v.get("name_suffix")
-                        for v in config.azure_multiple_vmss_vars.get(
-                            "vars_list", []
-                        )
-                    ]
-                )
-            ),
-            "in the multiple VMSS case, each name suffix of a VMSS"
-            " must be unique",
-        ),
-        # ADLS Gen2 is only supported if Accumulo 2.x is used
-        ConfigValidator(
-            lambda config, client: not config.use_adlsg2()
-            or config.version("accumulo").split(".")[0] == "2",
-            "ADLS Gen2 support requires Accumulo 2.x",
-        ),
     ],
     "launch": [
         # Fail when HDFS HA is NOT enabled and azure_multiple_vmss_vars.yml
@@ -272,6 +324,19 @@ AZURE_VALIDATIONS = {
             "HDFS HA is enabled, but azure_multiple_vmss_vars.yml does NOT"
             " specify ZKFC and / or Journal Node service roles",
         ),
+        # the native provisioner only creates a single VMSS (with an
+        # optional proxy VM) and none of the other resources of azure.yml
+        ConfigValidator(
+            lambda config, client: config.provisioner() == "ansible"
+            or not (
+                config.use_multiple_vmss()
+                or config.use_adlsg2()
+                or config.omsIntegrationNeeded()
+                or config.az_use_app_insights()
+            ),
+            "azure.provisioner = native does not support use_multiple_vmss,"
+            " use_adlsg2, az_oms_integration_needed or az_use_app_insights",
+        ),
     ],
     "setup": [
         ConfigValidator(
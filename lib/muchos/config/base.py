@@ -15,10 +15,12 @@
 # limitations under the License.
 #
 
+import hashlib
 from abc import ABCMeta, abstractmethod
 from collections import ChainMap
 from configparser import ConfigParser
 from distutils.version import StrictVersion
+from os import path
 from os.path import isfile
 from sys import exit
 from traceback import format_exc
@@ -171,6 +173,9 @@ _PLAY_VAR_DEFAULTS = {
 
 _EXTRA_VAR_DEFAULTS = {}
 
+# software installed on the images created by 'muchos bake'
+BAKED_SOFTWARE = ["accumulo", "hadoop", "spark", "zookeeper"]
+
 HASHLEN_ALGO_MAP = {
     32: "md5",
     40: "sha1",
@@ -195,6 +200,7 @@ class BaseConfig(ConfigParser, metaclass=ABCMeta):
         self.optionxform = str
         self.deploy_path = deploy_path
         self.read(config_path)
+        self.config_path = config_path
         self.hosts_path = hosts_path
         self.cluster_name = cluster_name
         self.cluster_type = self.get("general", "cluster_type")
@@ -202,6 +208,10 @@ class BaseConfig(ConfigParser, metaclass=ABCMeta):
         self.hosts = None
         self.checksums_path = checksums_path
         self.checksums_d = None
+        # set by the --refresh option to bypass cached cloud API lookups
+        self.refresh_cache = False
+        # set by the --setup option to set up the cluster after launch
+        self.setup_after_launch = False
         self._init_nodes()
 
     def ansible_host_vars(self):
@@ -347,6 +357,18 @@ class BaseConfig(ConfigParser, metaclass=ABCMeta):
             mounts.append(self.mount_root() + str(i))
         return mounts
 
+    @default("jbod")
+    @is_valid(is_in(["jbod", "striped"]))
+    def data_layout(self, node_type):
+        # 'jbod' mounts each data device of 'default' or 'worker' nodes on
+        # its own, 'striped' assembles them into one RAID0 array instead
+        return self.get("general", node_type + "_data_layout")
+
+    @ansible_play_var
+    @default(256)
+    def stripe_chunk_kb(self):
+        return self.getint("general", "stripe_chunk_kb")
+
     @abstractmethod
     @ansible_play_var
     def mount_root(self):
@@ -491,6 +513,13 @@ class BaseConfig(ConfigParser, metaclass=ABCMeta):
     def nodes(self):
         return self.node_d
 
+    def reload_nodes(self):
+        # re-reads [nodes] and the hosts file after they were rewritten
+        self.remove_section("nodes")
+        self.read(self.config_path)
+        self._init_nodes()
+        self.hosts = None
+
     def get_node(self, hostname):
         return self.node_d[hostname]
 
@@ -611,6 +640,50 @@ class BaseConfig(ConfigParser, metaclass=ABCMeta):
     def proxy_private_ip(self):
         return self.get_private_ip(self.proxy_hostname())
 
+    def cache_dir(self):
+        return path.join(self.deploy_path, "conf/cache")
+
+    @default(60)
+    def inventory_cache_ttl(self):
+        return self.getint("general", "inventory_cache_ttl")
+
+    def base_image(self):
+        # the cloud image that nodes are launched from (None for existing
+        # clusters)
+        return None
+
+    @ansible_play_var
+    def image_key(self):
+        # identifies the software installed by 'muchos bake' on top of the
+        # base image, so that a baked image is only used for the same
+        # versions and checksums
+        parts = [
+            str(self.base_image()),
+            self.get("general", "install_dir"),
+            self.resolve_value(
+                "java_package", default=_HOST_VAR_DEFAULTS["java_package"]
+            ),
+            self.resolve_value(
+                "maven_version", default=_HOST_VAR_DEFAULTS["maven_version"]
+            ),
+        ]
+        for software in BAKED_SOFTWARE:
+            if software == "spark" and not self.has_service("spark"):
+                continue
+            parts.append(
+                "{0}-{1}:{2}".format(
+                    software, self.version(software), self.checksum(software)
+                )
+            )
+        return hashlib.sha256("\n".join(parts).encode()).hexdigest()[:16]
+
+    def baked_image_name(self):
+        return "muchos-" + self.image_key()
+
+    @default(True)
+    def use_baked_image(self):
+        return self.getboolean("general", "use_baked_image")
+
     def get_performance_prop(self, prop):
         profile = self.get("performance", "profile")
         return self.get(profile, prop)
@@ -24,7 +24,11 @@ from .base import BaseConfig
 from .decorators import (
     ansible_play_var,
     default,
+    is_valid,
 )
+from .validators import is_in
+from ..cache import FileCache
+from ..ec2types import InstanceTypeCatalog
 from ..util import get_ephemeral_devices, get_arch
 
 
@@ -49,6 +53,7 @@ class Ec2DeployConfig(BaseConfig):
         self.sg_name = cluster_name + "-group"
         self.ephemeral_root = "ephemeral"
         self.cluster_template_d = None
+        self.instance_types = InstanceTypeCatalog(FileCache(self.cache_dir()))
         self.metrics_drive_root = "media-" + self.ephemeral_root
         self.init_template(templates_path)
 
@@ -58,6 +63,120 @@ class Ec2DeployConfig(BaseConfig):
     def verify_launch(self):
         self.verify_instance_type(self.get("ec2", "default_instance_type"))
         self.verify_instance_type(self.get("ec2", "worker_instance_type"))
+        if self.worker_launch_mode() == "fleet":
+            self.verify_fleet()
+        self.verify_fallbacks()
+        self.verify_ebs_volumes()
+        if self.hibernate():
+            self.verify_hibernation()
+        if self.placement_strategy() == "cluster" and (
+            len(self.subnet_ids()) > 1 or self.fallback_subnet_ids()
+        ):
+            exit(
+                "ERROR - A cluster placement group is limited to a single "
+                "availability zone, so only one subnet (and no fallback "
+                "subnets) can be used"
+            )
+
+    def verify_hibernation(self):
+        if self.cluster_template_d:
+            exit(
+                "ERROR - hibernate cannot be used with a cluster template. "
+                "Configure HibernationOptions and an encrypted root volume "
+                "in its launch requests instead"
+            )
+        if self.worker_launch_mode() == "fleet":
+            exit(
+                "ERROR - hibernate cannot be used when worker_launch_mode is "
+                "'fleet'"
+            )
+        for instance_type in self.launch_instance_types():
+            ec2_type = self.instance_types.get(instance_type)
+            if not ec2_type.hibernation_supported:
+                exit(
+                    "ERROR - EC2 instance type '{0}' does not support "
+                    "hibernation".format(instance_type)
+                )
+
+    def launch_instance_types(self):
+        # instance types selected for launching nodes (if not in template mode)
+        if self.cluster_template_d:
+            return []
+        instance_types = [
+            self.get("ec2", "default_instance_type"),
+            self.get("ec2", "worker_instance_type"),
+        ]
+        if self.worker_launch_mode() == "fleet":
+            instance_types.extend(self.fleet_instance_types())
+        instance_types.extend(self.fallback_instance_types("default"))
+        instance_types.extend(self.fallback_instance_types("worker"))
+        return sorted(set(instance_types))
+
+    def verify_fleet(self):
+        worker_type = self.get("ec2", "worker_instance_type")
+        allow_ebs_only = self.ebs_volumes("worker") > 0
+        for instance_type in self.fleet_instance_types():
+            self.verify_instance_type(instance_type)
+            # the devices of workers are mapped using worker_instance_type
+            if (
+                not self.cluster_template_d
+                and get_ephemeral_devices(
+                    instance_type, self.instance_types, allow_ebs_only
+                )
+                != self.worker_ephemeral_devices()
+            ):
+                exit(
+                    "ERROR - Fleet instance type '{0}' does not have the "
+                    "same ephemeral devices as worker_instance_type "
+                    "'{1}'".format(instance_type, worker_type)
+                )
+
+    def verify_fallbacks(self):
+        # nodes launched using a fallback instance type must have the same
+        # devices, so that they can be set up using node_type_map()
+        for node_type in ["default", "worker"]:
+            instance_type = self.get("ec2", node_type + "_instance_type")
+            allow_ebs_only = self.ebs_volumes(node_type) > 0
+            devices = get_ephemeral_devices(
+                instance_type, self.instance_types, allow_ebs_only
+            )
+            for fallback in self.fallback_instance_types(node_type):
+                self.verify_instance_type(fallback)
+                if (
+                    get_ephemeral_devices(
+                        fallback, self.instance_types, allow_ebs_only
+                    )
+                    != devices
+                ):
+                    exit(
+                        "ERROR - Fallback instance type '{0}' does not have "
+                        "the same ephemeral devices as {1}_instance_type "
+                        "'{2}'".format(fallback, node_type, instance_type)
+                    )
+
+    def verify_ebs_volumes(self):
+        for node_type in ["default", "worker"]:
+            if self.ebs_volumes(node_type) == 0:
+                continue
+            if self.cluster_template_d:
+                exit(
+                    "ERROR - {0}_ebs_volumes cannot be used with a cluster "
+                    "template. Add the volumes to the BlockDeviceMappings "
+                    "of its launch requests instead".format(node_type)
+                )
+            volume_type = self.ebs_volume_type(node_type)
+            if volume_type == "io2" and not self.ebs_volume_iops(node_type):
+                exit(
+                    "ERROR - {0}_ebs_volume_iops must be set for io2 "
+                    "volumes".format(node_type)
+                )
+            if volume_type != "gp3" and self.ebs_volume_throughput(
+                node_type
+            ):
+                exit(
+                    "ERROR - {0}_ebs_volume_throughput can only be set for "
+                    "gp3 volumes".format(node_type)
+                )
 
     def init_nodes(self):
         self.node_d = {}
@@ -81,19 +200,60 @@ class Ec2DeployConfig(BaseConfig):
             self.node_d[hostname] = service_list
 
     def default_ephemeral_devices(self):
-        return get_ephemeral_devices(self.get("ec2", "default_instance_type"))
+        return get_ephemeral_devices(
+            self.get("ec2", "default_instance_type"),
+            self.instance_types,
+            self.ebs_volumes("default") > 0,
+        )
 
     def worker_ephemeral_devices(self):
-        return get_ephemeral_devices(self.get("ec2", "worker_instance_type"))
+        return get_ephemeral_devices(
+            self.get("ec2", "worker_instance_type"),
+            self.instance_types,
+            self.ebs_volumes("worker") > 0,
+        )
 
     def max_ephemeral(self):
+        # number of data mounts of the node type that has the most
         return max(
-            (
-                len(self.default_ephemeral_devices()),
-                len(self.worker_ephemeral_devices()),
-            )
+            len(devices["mounts"]) for devices in self.node_type_map().values()
         )
 
+    def ebs_devices(self, node_type):
+        # Device names of the EBS data volumes of a node type, following
+        # those of its instance store volumes. On Nitro instances, EBS
+        # volumes are NVMe devices that are numbered in no particular order,
+        # so ec2.yml finds them by their volume id instead.
+        count = self.ebs_volumes(node_type)
+        if count == 0:
+            return []
+        instance_type = self.get("ec2", node_type + "_instance_type")
+        ephemeral = self.instance_types.get(instance_type).ephemeral
+        first = max(ord("f"), ord("b") + ephemeral)
+        return ["/dev/xvd" + chr(first + i) for i in range(0, count)]
+
+    def ebs_block_device_map(self, node_type):
+        bdm = []
+        for device in self.ebs_devices(node_type):
+            ebs = {
+                "DeleteOnTermination": True,
+                "VolumeSize": self.ebs_volume_size(node_type),
+                "VolumeType": self.ebs_volume_type(node_type),
+            }
+            iops = self.ebs_volume_iops(node_type)
+            if iops:
+                ebs["Iops"] = iops
+            throughput = self.ebs_volume_throughput(node_type)
+            if throughput:
+                ebs["Throughput"] = throughput
+            bdm.append(
+                {
+                    "DeviceName": device.replace("/dev/xvd", "/dev/sd"),
+                    "Ebs": ebs,
+                }
+            )
+        return bdm
+
     def node_type_map(self):
         if self.cluster_template_d:
             return self.cluster_template_d["devices"]
@@ -106,13 +266,26 @@ class Ec2DeployConfig(BaseConfig):
         ]
 
         for ntype, devices in node_list:
+            ebs_devices = self.ebs_devices(ntype)
+            num_devices = len(devices) + len(ebs_devices)
             node_types[ntype] = {
-                "mounts": self.mounts(len(devices)),
+                "mounts": self.mounts(num_devices),
                 "devices": devices,
+                "ebs_devices": ebs_devices,
             }
+            if self.data_layout(ntype) == "striped" and num_devices > 1:
+                # all devices are assembled into an array on a single mount
+                node_types[ntype]["mounts"] = self.mounts(1)
+                node_types[ntype]["layout"] = "striped"
 
         return node_types
 
+    def journal_dir(self):
+        return os.path.join(self.deploy_path, "conf/journal")
+
+    def base_image(self):
+        return self.get("ec2", "aws_ami", fallback=None)
+
     def mount_root(self):
         return "/media/" + self.ephemeral_root
 
@@ -126,6 +299,123 @@ class Ec2DeployConfig(BaseConfig):
     def force_format(self):
         return self.get("ec2", "force_format")
 
+    @ansible_play_var
+    @default(False)
+    def bootstrap_user_data(self):
+        return self.getboolean("ec2", "bootstrap_user_data")
+
+    @default(None)
+    def region(self):
+        return self.get("ec2", "region")
+
+    @default(20)
+    def api_max_pool_connections(self):
+        return self.getint("ec2", "api_max_pool_connections")
+
+    @default(10)
+    def api_max_attempts(self):
+        return self.getint("ec2", "api_max_attempts")
+
+    @default(False)
+    def print_api_stats(self):
+        return self.getboolean("ec2", "print_api_stats")
+
+    @default(False)
+    def use_launch_templates(self):
+        return self.getboolean("ec2", "use_launch_templates")
+
+    @default("instances")
+    @is_valid(is_in(["instances", "fleet"]))
+    def worker_launch_mode(self):
+        return self.get("ec2", "worker_launch_mode")
+
+    def fleet_instance_types(self):
+        if self.has_option("ec2", "fleet_instance_types"):
+            value = self.get("ec2", "fleet_instance_types")
+            if value:
+                return [t.strip() for t in value.split(",")]
+        return [self.get("ec2", "worker_instance_type")]
+
+    @default(0)
+    @is_valid(is_in(range(0, 101)))
+    def fleet_on_demand_percentage(self):
+        return self.getint("ec2", "fleet_on_demand_percentage")
+
+    @default(None)
+    @is_valid(is_in(["cluster", "partition", "spread"]))
+    def placement_strategy(self):
+        return self.get("ec2", "placement_strategy")
+
+    @default(3)
+    @is_valid(is_in(range(1, 8)))
+    def placement_partitions(self):
+        return self.getint("ec2", "placement_partitions")
+
+    def placement_group_name(self):
+        return self.cluster_name + "-placement"
+
+    def subnet_ids(self):
+        # nodes are spread across subnet_ids (e.g. one subnet per
+        # availability zone), if set, instead of using subnet_id
+        for option in ["subnet_ids", "subnet_id"]:
+            if self.has_option("ec2", option):
+                value = self.get("ec2", option)
+                if value:
+                    return [s.strip() for s in value.split(",")]
+        return []
+
+    def fallback_instance_types(self, node_type):
+        # instance types tried in order when EC2 lacks capacity for the
+        # instance type of a 'default' or 'worker' node
+        option = node_type + "_fallback_instance_types"
+        if not self.cluster_template_d and self.has_option("ec2", option):
+            value = self.get("ec2", option)
+            if value:
+                return [t.strip() for t in value.split(",")]
+        return []
+
+    def fallback_subnet_ids(self):
+        if self.has_option("ec2", "fallback_subnet_ids"):
+            value = self.get("ec2", "fallback_subnet_ids")
+            if value:
+                return [s.strip() for s in value.split(",")]
+        return []
+
+    @default(8)
+    def launch_max_workers(self):
+        return self.getint("ec2", "launch_max_workers")
+
+    @default(False)
+    def wait_for_status_ok(self):
+        return self.getboolean("ec2", "wait_for_status_ok")
+
+    @default(False)
+    def hibernate(self):
+        return self.getboolean("ec2", "hibernate")
+
+    @default(0)
+    @is_valid(is_in(range(0, 12)))
+    def ebs_volumes(self, node_type):
+        # number of EBS data volumes attached to 'default' or 'worker' nodes
+        return self.getint("ec2", node_type + "_ebs_volumes")
+
+    @default(500)
+    def ebs_volume_size(self, node_type):
+        return self.getint("ec2", node_type + "_ebs_volume_size")
+
+    @default("gp3")
+    @is_valid(is_in(["gp3", "io2"]))
+    def ebs_volume_type(self, node_type):
+        return self.get("ec2", node_type + "_ebs_volume_type")
+
+    @default(None)
+    def ebs_volume_iops(self, node_type):
+        return self.getint("ec2", node_type + "_ebs_volume_iops")
+
+    @default(None)
+    def ebs_volume_throughput(self, node_type):
+        return self.getint("ec2", node_type + "_ebs_volume_throughput")
+
     def data_dirs_common(self, nodeType):
         return self.node_type_map()[nodeType]["mounts"]
 
@@ -140,7 +430,7 @@ class Ec2DeployConfig(BaseConfig):
 
     def verify_instance_type(self, instance_type):
         if not self.cluster_template_d:
-            if get_arch(instance_type) == "pvm":
+            if get_arch(instance_type, self.instance_types) == "pvm":
                 exit(
                     "ERROR - Configuration contains instance type '{0}' "
                     "that uses pvm architecture."
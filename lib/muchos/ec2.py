@@ -16,74 +16,607 @@
 # limitations under the License.
 #
 
+import base64
 import os
+import random
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from sys import exit
-from botocore.exceptions import ClientError
+from botocore.exceptions import ClientError, WaiterError
 from .util import AMI_HELP_MSG, get_block_device_map
 from os import path
 import time
-import boto3
+from . import cloudinit
+from .cache import FileCache
+from .config.base import BAKED_SOFTWARE
+from .ec2client import Ec2Client
 from .existing import ExistingCluster
 import json
 from string import Template
 
+# EC2 error codes returned when an instance type cannot be launched in an
+# availability zone, which are handled by trying the fallbacks
+CAPACITY_ERROR_CODES = (
+    "InsufficientInstanceCapacity",
+    "InsufficientHostCapacity",
+    "InsufficientCapacity",
+    "Unsupported",
+)
+
+# maximum number of instance IDs accepted by a single EC2 API request
+INSTANCE_ID_BATCH_SIZE = 1000
+
+# number of concurrent requests used for bulk instance operations
+BULK_MAX_WORKERS = 4
+
+# states of instances that have not been terminated
+ACTIVE_STATES = ["pending", "running", "stopping", "stopped"]
+
+# bounds (in seconds) of the interval used to poll launching instances
+READY_POLL_MIN_DELAY = 2
+READY_POLL_MAX_DELAY = 30
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def node_ids(nodes):
+    return [node["InstanceId"] for node in nodes]
+
+
+def node_name(node):
+    for tag in node.get("Tags", []):
+        if tag["Key"] == "Name":
+            return tag["Value"]
+    return None
+
+
+def without_spot(nodes, action):
+    # Spot workers of a fleet are one-time Spot instances, which cannot be
+    # stopped or started, so they are left out (they terminate on shutdown)
+    spot = [n for n in nodes if n.get("InstanceLifecycle") == "spot"]
+    if spot:
+        print(
+            "Skipping {0} Spot nodes which cannot be {1}: {2}".format(
+                len(spot), action, ", ".join(map(str, map(node_name, spot)))
+            )
+        )
+    return [n for n in nodes if n.get("InstanceLifecycle") != "spot"]
+
+
+def call_with_backoff(func, retry_codes, max_attempts=8, **kwargs):
+    # retries the EC2 API call using exponential backoff with jitter when
+    # it fails with one of the given error codes, which are returned while
+    # EC2 is still catching up (e.g. with a new instance). Throttled calls
+    # are already retried by the (adaptive) retry mode of the EC2 client.
+    delay = 1
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return func(**kwargs)
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if code not in retry_codes or attempt == max_attempts:
+                raise
+            time.sleep(delay + random.uniform(0, delay))
+            delay = min(delay * 2, 30)
+
 
 class Ec2Cluster(ExistingCluster):
     def __init__(self, config):
         ExistingCluster.__init__(self, config)
+        self._ec2 = None
+        self._ec2_lock = threading.Lock()
+        # records the instance launched for each hostname, so that a failed
+        # launch can be resumed
+        self.journal = FileCache(config.journal_dir())
+        self.journal_lock = threading.Lock()
+        self._image_id = None
+        self._image = None
+        self._image_root_volume = None
 
-    def launch_node(self, hostname, services, sg_id):
-        request = self.init_request(hostname, services, sg_id)
-
-        request["MinCount"] = 1
-        request["MaxCount"] = 1
-
-        tags = [
-            {
-                "Key": "Name",
-                "Value": self.config.cluster_name + "-" + hostname,
-            },
-            {"Key": "Muchos", "Value": self.config.cluster_name},
-        ]
+    @property
+    def ec2(self):
+        # a single EC2 client is created on first use and shared by all
+        # threads of this command
+        config = self.config
+        with self._ec2_lock:
+            if self._ec2 is None:
+                self._ec2 = Ec2Client(
+                    region=config.region(),
+                    max_pool_connections=config.api_max_pool_connections(),
+                    max_attempts=config.api_max_attempts(),
+                )
+            return self._ec2
 
+    def cluster_tags(self):
+        tags = [{"Key": "Muchos", "Value": self.config.cluster_name}]
         for key, val in self.config.instance_tags().items():
             tags.append({"Key": key, "Value": val})
+        return tags
+
+    def launch_nodes(self, nodes, sg_id):
+        # in fleet mode, all worker nodes are launched by one EC2 Fleet
+        fleet_nodes = {}
+        if self.config.worker_launch_mode() == "fleet":
+            fleet_nodes = {
+                hostname: services
+                for hostname, services in nodes.items()
+                if "worker" in services
+            }
+
+        # nodes are placed by their index among the worker (or other) nodes
+        # in [nodes], which stays the same when nodes are added later
+        indexes = {}
+        counts = {True: 0, False: 0}
+        for hostname, services in self.config.nodes().items():
+            is_worker = "worker" in services
+            indexes[hostname] = counts[is_worker]
+            counts[is_worker] += 1
+
+        # hosts whose launch requests are identical are launched together
+        # using a single run_instances call (with MinCount/MaxCount)
+        groups = {}
+        for hostname, services in nodes.items():
+            if hostname in fleet_nodes:
+                continue
+            node_type = "worker" if "worker" in services else "default"
+            request = self.place_request(
+                self.init_request(hostname, services, sg_id),
+                node_type == "worker",
+                indexes[hostname],
+            )
+            key = (node_type, json.dumps(request, sort_keys=True))
+            if key not in groups:
+                groups[key] = (request, [], node_type)
+            groups[key][1].append(hostname)
+
+        instance_d = {}
+        with ThreadPoolExecutor(
+            max_workers=self.config.launch_max_workers()
+        ) as executor:
+            futures = [
+                executor.submit(
+                    self.launch_group, request, hostnames, node_type
+                )
+                for request, hostnames, node_type in groups.values()
+            ]
+            if fleet_nodes:
+                futures.append(
+                    executor.submit(self.launch_fleet, fleet_nodes, sg_id)
+                )
+            launched = []
+            errors = []
+            for future in as_completed(futures):
+                try:
+                    launched.extend(future.result())
+                except ClientError as e:
+                    errors.append(e)
+
+            # instances are tagged with their hostname once they exist
+            futures = [
+                executor.submit(
+                    self.tag_node, instance["InstanceId"], hostname
+                )
+                for instance, hostname in launched
+            ]
+            for future in as_completed(futures):
+                future.result()
+
+        for instance, hostname in launched:
+            instance_d[instance["InstanceId"]] = hostname
+
+        missing = sorted(set(nodes) - set(instance_d.values()))
+        if missing:
+            exit(
+                "ERROR - Failed to launch {0} nodes ({1}) due to:\n\n{2}"
+                "\n\n{3}\n\nThe {4} nodes that were launched are recorded "
+                "in {5}. Run launch again to launch only the missing "
+                "nodes.".format(
+                    len(missing),
+                    ", ".join(missing),
+                    "\n".join(str(e) for e in errors),
+                    AMI_HELP_MSG,
+                    len(instance_d),
+                    self.journal.path(self.config.cluster_name),
+                )
+            )
+        return instance_d
 
+    def read_journal(self):
+        # returns {hostname: {"InstanceId": ..., "InstanceType": ...}}
+        return self.journal.get(self.config.cluster_name, None) or {}
+
+    def record_launched(self, launched):
+        # launched is a list of (instance, hostname)
+        with self.journal_lock:
+            journal = self.read_journal()
+            for instance, hostname in launched:
+                journal[hostname] = {
+                    "InstanceId": instance["InstanceId"],
+                    "InstanceType": instance.get("InstanceType"),
+                }
+            self.journal.put(self.config.cluster_name, journal)
+
+    def forget_launched(self, hostnames):
+        with self.journal_lock:
+            journal = self.read_journal()
+            for hostname in hostnames:
+                journal.pop(hostname, None)
+            self.journal.put(self.config.cluster_name, journal)
+
+    def match_nodes(self, nodes, active):
+        # Returns {instance_id: hostname} for the active instances that were
+        # launched for the given nodes by a previous launch, as recorded in
+        # the journal or by the Name tag of the instance
+        journal_hosts = {
+            entry["InstanceId"]: hostname
+            for hostname, entry in self.read_journal().items()
+        }
+        names = {self.config.cluster_name + "-" + h: h for h in nodes}
+        matched = {}
+        for node in active:
+            hostname = journal_hosts.get(node["InstanceId"])
+            for tag in node.get("Tags", []):
+                if tag["Key"] == "Name" and hostname is None:
+                    hostname = names.get(tag["Value"])
+            if hostname in nodes and hostname not in matched.values():
+                matched[node["InstanceId"]] = hostname
+        return matched
+
+    def launch_missing(self, nodes, sg_id, active):
+        # launches the nodes that do not have an instance yet. The pending
+        # or running instances left by a previous launch are adopted.
+        instance_d = self.match_nodes(nodes, active)
+        if instance_d:
+            by_id = {node["InstanceId"]: node for node in active}
+            for instance_id, hostname in instance_d.items():
+                state = by_id[instance_id]["State"]["Name"]
+                if state not in ("pending", "running"):
+                    exit(
+                        "ERROR - Instance {0} of node {1} is {2}. Start or "
+                        "terminate it before trying again".format(
+                            instance_id, hostname, state
+                        )
+                    )
+            print(
+                "Adopting {0} node(s) launched previously: {1}".format(
+                    len(instance_d), ", ".join(sorted(instance_d.values()))
+                )
+            )
+            self.record_launched(
+                [(by_id[i], hostname) for i, hostname in instance_d.items()]
+            )
+            for instance_id, hostname in instance_d.items():
+                self.tag_node(instance_id, hostname)
+        remaining = {
+            h: s for h, s in nodes.items() if h not in instance_d.values()
+        }
+        if remaining:
+            instance_d.update(self.launch_nodes(remaining, sg_id))
+        return instance_d
+
+    def launch_group(self, request, hostnames, node_type="default"):
+        request = dict(request)
         request["TagSpecifications"] = [
-            {"ResourceType": "instance", "Tags": tags}
+            {"ResourceType": "instance", "Tags": self.cluster_tags()}
         ]
 
+        user_data = self.user_data(node_type)
+        if user_data is not None:
+            request["UserData"] = user_data
+
+        # If EC2 lacks capacity for the instance type in the subnet's
+        # availability zone, the nodes that could not be launched are
+        # launched using the next fallback instance type or subnet. Any
+        # other ClientError is handled by launch_nodes.
+        remaining = list(hostnames)
+        launched = []
+        error = None
+        for candidate in self.fallback_requests(request, node_type):
+            candidate["MinCount"] = 1
+            candidate["MaxCount"] = len(remaining)
+            try:
+                response = self.ec2.run_instances(**candidate)
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in CAPACITY_ERROR_CODES:
+                    raise
+                error = e
+                print(
+                    "Could not launch {0} as {1}: {2}".format(
+                        ", ".join(remaining),
+                        self.describe_request(candidate),
+                        e.response["Error"]["Code"],
+                    )
+                )
+                continue
+
+            instances = sorted(
+                response["Instances"], key=lambda i: i["AmiLaunchIndex"]
+            )
+            batch = list(zip(instances, remaining))
+            print(
+                "Launching {0} node(s) {1} as {2} using {3}".format(
+                    len(batch),
+                    ", ".join(h for _, h in batch),
+                    self.describe_request(candidate),
+                    candidate.get("ImageId", "its launch template"),
+                )
+            )
+            self.record_launched(batch)
+            launched.extend(batch)
+            remaining = remaining[len(batch):]
+            if not remaining:
+                break
+
+        if remaining and error is not None:
+            if not launched:
+                raise error
+            print(error)
+        return launched
+
+    def fallback_requests(self, request, node_type):
+        # yields the launch request, followed by a copy of it for every
+        # fallback instance type, in every fallback subnet
+        instance_types = [request.get("InstanceType")]
+        if "InstanceType" in request:
+            instance_types += self.config.fallback_instance_types(node_type)
+        subnet_ids = [None]
+        if "NetworkInterfaces" in request:
+            subnet_ids += self.config.fallback_subnet_ids()
+        for subnet_id in subnet_ids:
+            for instance_type in instance_types:
+                candidate = dict(request)
+                if instance_type != request.get("InstanceType"):
+                    candidate["InstanceType"] = instance_type
+                    candidate["BlockDeviceMappings"] = self.block_device_map(
+                        instance_type, node_type
+                    )
+                if subnet_id is not None:
+                    interfaces = [
+                        dict(i) for i in candidate["NetworkInterfaces"]
+                    ]
+                    interfaces[0]["SubnetId"] = subnet_id
+                    candidate["NetworkInterfaces"] = interfaces
+                yield candidate
+
+    @staticmethod
+    def describe_request(request):
+        description = request.get("InstanceType", "template instance type")
+        interfaces = request.get("NetworkInterfaces", [{}])
+        if "SubnetId" in interfaces[0]:
+            description += " in " + interfaces[0]["SubnetId"]
+        return description
+
+    def launch_fleet(self, nodes, sg_id):
+        hostnames = sorted(nodes)
+        request = self.place_request(
+            self.init_request(hostnames[0], nodes[hostnames[0]], sg_id), True
+        )
+        instance_types = self.config.fleet_instance_types()
+        # the fleet spreads workers across all subnets (and partitions)
+        subnet_ids = self.config.subnet_ids()
+        overrides = [
+            {"InstanceType": instance_type}
+            for instance_type in instance_types
+        ]
+        if len(subnet_ids) > 1:
+            overrides = [
+                dict(override, SubnetId=subnet_id)
+                for override in overrides
+                for subnet_id in subnet_ids
+            ]
+        on_demand_count = (
+            len(hostnames) * self.config.fleet_on_demand_percentage() // 100
+        )
+        spot_count = len(hostnames) - on_demand_count
+
+        # create_fleet requires a launch template. Unless the worker request
+        # already refers to a registered one, a temporary launch template is
+        # created, which is only needed while the fleet is being fulfilled.
+        temp_template_id = None
+        try:
+            if "LaunchTemplate" in request:
+                template_spec = request["LaunchTemplate"]
+            else:
+                template_data = self.launch_template_data(
+                    request, self.user_data("worker")
+                )
+                if spot_count > 0:
+                    # spot instances launched by an instant fleet are
+                    # one-time requests, which can only be terminated
+                    template_data["InstanceInitiatedShutdownBehavior"] = (
+                        "terminate"
+                    )
+                # the name is unique, as a template left by a killed launch
+                # is only deleted by terminate (through its Muchos tag)
+                response = self.ec2.create_launch_template(
+                    LaunchTemplateName="{0}-worker-fleet-{1}".format(
+                        self.config.cluster_name, uuid.uuid4().hex[:8]
+                    ),
+                    LaunchTemplateData=template_data,
+                    TagSpecifications=[
+                        {
+                            "ResourceType": "launch-template",
+                            "Tags": self.cluster_tags(),
+                        }
+                    ],
+                )
+                temp_template_id = response["LaunchTemplate"][
+                    "LaunchTemplateId"
+                ]
+                template_spec = {
+                    "LaunchTemplateId": temp_template_id,
+                    "Version": "$Latest",
+                }
+            print(
+                "Launching {0} worker node(s) ({1} spot, {2} on-demand) "
+                "using EC2 Fleet with instance types {3}".format(
+                    len(hostnames),
+                    spot_count,
+                    on_demand_count,
+                    ", ".join(instance_types),
+                )
+            )
+            response = self.ec2.create_fleet(
+                Type="instant",
+                LaunchTemplateConfigs=[
+                    {
+                        "LaunchTemplateSpecification": template_spec,
+                        "Overrides": overrides,
+                    }
+                ],
+                TargetCapacitySpecification={
+                    "TotalTargetCapacity": len(hostnames),
+                    "OnDemandTargetCapacity": on_demand_count,
+                    "SpotTargetCapacity": spot_count,
+                    "DefaultTargetCapacityType": (
+                        "spot" if spot_count > 0 else "on-demand"
+                    ),
+                },
+                SpotOptions={"AllocationStrategy": "price-capacity-optimized"},
+                OnDemandOptions={"AllocationStrategy": "lowest-price"},
+                TagSpecifications=[
+                    {"ResourceType": "instance", "Tags": self.cluster_tags()}
+                ],
+            )
+        finally:
+            # a ClientError is handled by launch_nodes
+            if temp_template_id is not None:
+                self.ec2.delete_launch_template(
+                    LaunchTemplateId=temp_template_id
+                )
+
+        instances = []
+        for fulfilled in response.get("Instances", []):
+            for instance_id in fulfilled["InstanceIds"]:
+                instances.append(
+                    {
+                        "InstanceId": instance_id,
+                        "InstanceType": fulfilled.get("InstanceType"),
+                    }
+                )
+        instances.sort(key=lambda i: i["InstanceId"])
+        # the workers that were not launched are reported by launch_nodes
+        if len(instances) != len(hostnames):
+            print(
+                "EC2 Fleet only launched {0} of {1} worker nodes. "
+                "Errors:\n{2}".format(
+                    len(instances),
+                    len(hostnames),
+                    "\n".join(
+                        "{0}: {1}".format(
+                            error.get("ErrorCode"), error.get("ErrorMessage")
+                        )
+                        for error in response.get("Errors", [])
+                    ),
+                )
+            )
+        launched = list(zip(instances, hostnames))
+        self.record_launched(launched)
+        return launched
+
+    def place_request(self, request, is_worker, index=None):
+        # Returns a copy of the launch request that places the node in the
+        # cluster placement group and in one of the subnets. The index of the
+        # node among the worker (or other) nodes selects its subnet and, for
+        # workers, its partition, so that workers are spread evenly. If index
+        # is None, the choice is left to EC2.
+        request = dict(request)
+        strategy = self.config.placement_strategy()
+        if strategy is not None:
+            placement = dict(request.get("Placement", {}))
+            placement["GroupName"] = self.config.placement_group_name()
+            if strategy == "partition" and is_worker and index is not None:
+                placement["PartitionNumber"] = (
+                    index % self.config.placement_partitions() + 1
+                )
+            request["Placement"] = placement
+
+        subnet_ids = self.config.subnet_ids()
+        if (
+            len(subnet_ids) > 1
+            and index is not None
+            and "NetworkInterfaces" in request
+        ):
+            interfaces = [dict(i) for i in request["NetworkInterfaces"]]
+            interfaces[0]["SubnetId"] = subnet_ids[index % len(subnet_ids)]
+            request["NetworkInterfaces"] = interfaces
+        return request
+
+    def user_data(self, node_type="default"):
+        user_data = None
         if self.config.has_option("ec2", "user_data_path"):
             user_data_path = self.config.get("ec2", "user_data_path")
             with open(user_data_path, "r") as user_data_file:
                 user_data = user_data_file.read()
-            request["UserData"] = user_data
-
-        ec2 = boto3.client("ec2")
-        response = None
-        try:
-            response = ec2.run_instances(**request)
-        except ClientError as e:
-            exit(
-                "ERROR - Failed to launch EC2 instance due to exception:"
-                "\n\n{0}\n\n{1}".format(e, AMI_HELP_MSG)
+        if self.config.bootstrap_user_data():
+            return cloudinit.combine(
+                self.bootstrap_cloud_config(node_type), user_data
             )
+        return user_data
 
-        if response is None or len(response["Instances"]) != 1:
-            exit("ERROR - Failed to start {0} node".format(hostname))
+    def bootstrap_cloud_config(self, node_type):
+        # cloud-init prepares the node while it boots, so that common.yml
+        # only needs to verify the work instead of doing it over SSH
+        config = self.config
+        devices = config.node_type_map()[node_type]
+        return cloudinit.cloud_config(
+            # striped devices are assembled by common.yml before formatting
+            []
+            if devices.get("layout") == "striped"
+            else devices["devices"],
+            devices["mounts"],
+            config.fstype(),
+            config.force_format(),
+            "{0}:{1}".format(
+                config.get("general", "cluster_user"),
+                config.get("general", "cluster_group"),
+            ),
+            cloudinit.BASE_PACKAGES
+            + [
+                config.resolve_value(
+                    "java_package", default="java-1.8.0-openjdk-devel"
+                )
+            ],
+        )
 
-        print(
-            "Launching {0} node using {1}".format(hostname, request["ImageId"])
+    @staticmethod
+    def launch_template_data(request, user_data):
+        # converts a run_instances request into launch template data
+        data = {
+            key: val
+            for key, val in request.items()
+            if key not in ("MinCount", "MaxCount", "TagSpecifications")
+        }
+        if user_data is not None:
+            data["UserData"] = base64.b64encode(
+                user_data.encode("utf-8")
+            ).decode("ascii")
+        return data
+
+    def tag_node(self, instance_id, hostname):
+        # newly launched instances may not be visible to create_tags yet
+        call_with_backoff(
+            self.ec2.create_tags,
+            retry_codes=("InvalidInstanceID.NotFound",),
+            Resources=[instance_id],
+            Tags=[
+                {
+                    "Key": "Name",
+                    "Value": self.config.cluster_name + "-" + hostname,
+                }
+            ],
         )
-        return response["Instances"][0]
 
     def create_security_group(self):
-        ec2 = boto3.client("ec2")
         sg = self.config.sg_name
         create_group = True
         group_id = None
         try:
-            response = ec2.describe_security_groups(
+            response = self.ec2.describe_security_groups(
                 Filters=[{"Name": "group-name", "Values": [sg]}]
             )
             if len(response["SecurityGroups"]) > 0:
@@ -100,12 +633,12 @@ class Ec2Cluster(ExistingCluster):
             }
             if self.config.has_option("ec2", "vpc_id"):
                 request["VpcId"] = self.config.get("ec2", "vpc_id")
-            response = ec2.create_security_group(**request)
+            response = self.ec2.create_security_group(**request)
             group_id = response["GroupId"]
-            ec2.authorize_security_group_ingress(
+            self.ec2.authorize_security_group_ingress(
                 GroupName=sg, SourceSecurityGroupName=sg
             )
-            ec2.authorize_security_group_ingress(
+            self.ec2.authorize_security_group_ingress(
                 GroupName=sg,
                 IpProtocol="tcp",
                 FromPort=22,
@@ -114,11 +647,76 @@ class Ec2Cluster(ExistingCluster):
             )
         return group_id
 
+    def create_placement_group(self):
+        strategy = self.config.placement_strategy()
+        name = self.config.placement_group_name()
+        request = {
+            "GroupName": name,
+            "Strategy": strategy,
+            "TagSpecifications": [
+                {
+                    "ResourceType": "placement-group",
+                    "Tags": self.cluster_tags(),
+                }
+            ],
+        }
+        if strategy == "partition":
+            request["PartitionCount"] = self.config.placement_partitions()
+        try:
+            self.ec2.create_placement_group(**request)
+            print(
+                "Created {0} placement group '{1}'".format(strategy, name)
+            )
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code != "InvalidPlacementGroup.Duplicate":
+                exit(
+                    "ERROR - Failed to create placement group '{0}' due to "
+                    "exception:\n{1}".format(name, e)
+                )
+            print("Using existing placement group '{0}'".format(name))
+
+    def delete_placement_group(self):
+        name = self.config.placement_group_name()
+        try:
+            # instances can take a few more seconds to leave the group
+            call_with_backoff(
+                self.ec2.delete_placement_group,
+                retry_codes=("InvalidPlacementGroup.InUse",),
+                GroupName=name,
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "InvalidPlacementGroup.Unknown":
+                return
+            exit(
+                "ERROR - Failed to delete placement group '{0}' due to "
+                "exception:\n{1}".format(name, e)
+            )
+        print("Deleted placement group '{0}'".format(name))
+
+    def wait_until_terminated(self, instance_ids):
+        print(
+            "Waiting for {0} nodes to terminate...".format(len(instance_ids))
+        )
+        waiter = self.ec2.get_waiter("instance_terminated")
+        try:
+            for ids in chunks(list(instance_ids), INSTANCE_ID_BATCH_SIZE):
+                waiter.wait(
+                    InstanceIds=ids,
+                    WaiterConfig={"Delay": 5, "MaxAttempts": 120},
+                )
+        except WaiterError as e:
+            exit(
+                "ERROR - Nodes did not terminate, so the resources of {0} "
+                "cluster were not deleted:\n{1}".format(
+                    self.config.cluster_name, e
+                )
+            )
+
     def delete_security_group(self):
         sg_id = None
-        ec2 = boto3.client("ec2")
         try:
-            response = ec2.describe_security_groups(
+            response = self.ec2.describe_security_groups(
                 Filters=[
                     {"Name": "group-name", "Values": [self.config.sg_name]}
                 ]
@@ -140,20 +738,18 @@ class Ec2Cluster(ExistingCluster):
             "Attempting to delete security group '{0}' "
             "with id '{1}'...".format(self.config.sg_name, sg_id)
         )
-        sg_exists = True
-        while sg_exists:
-            try:
-                request = {"GroupId": sg_id}
-                ec2.delete_security_group(**request)
-                sg_exists = False
-            except ClientError as e:
-                print(
-                    "Failed to delete security group '{0}' due to "
-                    "exception below:\n{1}\nRetrying in 10 sec...".format(
-                        self.config.sg_name, e
-                    )
-                )
-                time.sleep(10)
+        # network interfaces can take a few more seconds to be released
+        try:
+            call_with_backoff(
+                self.ec2.delete_security_group,
+                retry_codes=("DependencyViolation",),
+                GroupId=sg_id,
+            )
+        except ClientError as e:
+            exit(
+                "ERROR - Failed to delete security group '{0}' due to "
+                "exception below:\n{1}".format(self.config.sg_name, e)
+            )
         print("Deleted security group")
 
     def init_request(self, hostname, services, sg_id):
@@ -174,15 +770,12 @@ class Ec2Cluster(ExistingCluster):
             ]
         }
 
-        if self.config.has_option("ec2", "subnet_id"):
-            request["NetworkInterfaces"][0]["SubnetId"] = self.config.get(
-                "ec2", "subnet_id"
-            )
+        subnet_ids = self.config.subnet_ids()
+        if subnet_ids:
+            request["NetworkInterfaces"][0]["SubnetId"] = subnet_ids[0]
 
-        if "worker" in services:
-            instance_type = self.config.get("ec2", "worker_instance_type")
-        else:
-            instance_type = self.config.get("ec2", "default_instance_type")
+        node_type = "worker" if "worker" in services else "default"
+        instance_type = self.config.get("ec2", node_type + "_instance_type")
         request["InstanceType"] = instance_type
         request["InstanceInitiatedShutdownBehavior"] = self.config.get(
             "ec2", "shutdown_behavior"
@@ -194,8 +787,12 @@ class Ec2Cluster(ExistingCluster):
         if not image_id:
             exit("aws_ami property was not properly")
 
-        request["ImageId"] = image_id
-        request["BlockDeviceMappings"] = get_block_device_map(instance_type)
+        request["ImageId"] = self.image_id()
+        request["BlockDeviceMappings"] = self.block_device_map(
+            instance_type, node_type
+        )
+        if self.config.hibernate():
+            request["HibernationOptions"] = {"Configured": True}
 
         if self.config.has_option("ec2", "key_name"):
             request["KeyName"] = self.config.get("ec2", "key_name")
@@ -203,12 +800,6 @@ class Ec2Cluster(ExistingCluster):
         return request
 
     def launch(self):
-        if self.active_nodes():
-            exit(
-                "ERROR - There are already instances "
-                "running for {0} cluster".format(self.config.cluster_name)
-            )
-
         if path.isfile(self.config.hosts_path):
             exit(
                 "ERROR - A hosts file already exists at {0}. "
@@ -217,115 +808,579 @@ class Ec2Cluster(ExistingCluster):
                 )
             )
 
+        # instances left by a failed launch are adopted, any others must be
+        # terminated first
+        active = list(self.iter_status(ACTIVE_STATES))
+        nodes = self.config.nodes()
+        matched = self.match_nodes(nodes, active)
+        unknown = [
+            node["InstanceId"]
+            for node in active
+            if node["InstanceId"] not in matched
+        ]
+        if unknown:
+            exit(
+                "ERROR - There are already instances running for {0} "
+                "cluster that were not launched for its nodes: {1}".format(
+                    self.config.cluster_name, ", ".join(unknown)
+                )
+            )
+
+        self.update_instance_types()
         self.config.verify_launch()
+        self.verify_architecture(self.config.launch_instance_types())
 
         print("Launching {0} cluster".format(self.config.cluster_name))
 
+        sg_id = self.security_group_id()
+        if self.config.placement_strategy() is not None:
+            self.create_placement_group()
+
+        instance_d = self.launch_missing(nodes, sg_id, active)
+        self.invalidate_inventory()
+
+        # with --setup, nodes are set up as soon as they pass status checks
+        setup = self.config.setup_after_launch
+        instances = self.wait_until_ready(
+            instance_d, self.config.wait_for_status_ok() and not setup
+        )
+        self.write_hosts_file(instance_d, instances)
+
+        print(
+            "All {0} nodes have started. Created hosts file at {1}".format(
+                len(instances), self.config.hosts_path
+            )
+        )
+        if setup:
+            self.setup_as_ready(instance_d)
+
+    def block_device_map(self, instance_type, node_type="default"):
+        bdm = get_block_device_map(
+            instance_type,
+            self.config.instance_types,
+            self.config.ebs_volumes(node_type) > 0,
+        )
+        if self.config.hibernate():
+            # hibernation saves the memory of an instance to its root
+            # volume, which must be encrypted and large enough to hold it
+            root_device, root_size = self.image_root_volume()
+            memory_mib = self.config.instance_types.get(
+                instance_type
+            ).memory_mib
+            bdm[0] = {
+                "DeviceName": root_device,
+                "Ebs": {
+                    "DeleteOnTermination": True,
+                    "Encrypted": True,
+                    "VolumeSize": root_size + -(-memory_mib // 1024),
+                },
+            }
+        return bdm + self.config.ebs_block_device_map(node_type)
+
+    def image_root_volume(self):
+        # returns the device name and size (in GiB) of the root volume of
+        # the image that nodes are launched from
+        if self._image_root_volume is None:
+            image = self.image()
+            image_id = image["ImageId"]
+            root_device = image.get("RootDeviceName")
+            for mapping in image.get("BlockDeviceMappings", []):
+                if mapping["DeviceName"] == root_device and "Ebs" in mapping:
+                    self._image_root_volume = (
+                        root_device,
+                        mapping["Ebs"]["VolumeSize"],
+                    )
+            if self._image_root_volume is None:
+                exit(
+                    "ERROR - Image {0} does not support hibernation, as it "
+                    "does not have an EBS root volume".format(image_id)
+                )
+        return self._image_root_volume
+
+    def image(self):
+        # describes the image that nodes are launched from
+        if self._image is None:
+            response = self.ec2.describe_images(ImageIds=[self.image_id()])
+            self._image = response["Images"][0]
+        return self._image
+
+    def verify_architecture(self, instance_types, image=None):
+        # an instance type that cannot run the processor architecture of the
+        # image (by default, the image that nodes are launched from) fails
+        # to launch, e.g. a Graviton type with an x86_64 image
+        if not instance_types:
+            return
+        image = image or self.image()
+        architecture = image.get("Architecture")
+        for instance_type in instance_types:
+            ec2_type = self.config.instance_types.get(instance_type)
+            if architecture not in ec2_type.architectures:
+                exit(
+                    "ERROR - EC2 instance type '{0}' ({1}) cannot run image "
+                    "{2}, which is {3}".format(
+                        instance_type,
+                        ", ".join(ec2_type.architectures),
+                        image["ImageId"],
+                        architecture,
+                    )
+                )
+
+    def image_id(self):
+        # nodes are launched from the image baked by 'muchos bake' for the
+        # configured software, if there is one
+        if self._image_id is None:
+            self._image_id = self.config.get("ec2", "aws_ami")
+            if self.config.use_baked_image():
+                baked_id = self.find_baked_image()
+                if baked_id is not None:
+                    print(
+                        "Using baked image '{0}' ({1})".format(
+                            self.config.baked_image_name(), baked_id
+                        )
+                    )
+                    self._image_id = baked_id
+        return self._image_id
+
+    def find_baked_image(self):
+        response = self.ec2.describe_images(
+            Owners=["self"],
+            Filters=[
+                {
+                    "Name": "name",
+                    "Values": [self.config.baked_image_name()],
+                },
+                {"Name": "state", "Values": ["available"]},
+            ],
+        )
+        for image in response["Images"]:
+            return image["ImageId"]
+        return None
+
+    def bake(self):
+        # launches a builder node from aws_ami, installs the software of the
+        # cluster on it and creates an AMI from it
+        config = self.config
+        self.verify_bake()
+        name = config.baked_image_name()
+        image_id = self.find_baked_image()
+        if image_id is not None:
+            print(
+                "Image '{0}' ({1}) was already baked for the software of {2} "
+                "cluster".format(name, image_id, config.cluster_name)
+            )
+            return
+
+        print("Baking image '{0}' from {1}".format(name, config.base_image()))
+        self.update_instance_types()
+        hostname = "bake-builder"
+        request = Ec2Cluster.init_request(
+            self, hostname, [], self.security_group_id()
+        )
+        request["ImageId"] = config.base_image()
+        response = self.ec2.describe_images(ImageIds=[request["ImageId"]])
+        self.verify_architecture(
+            [request["InstanceType"]], response["Images"][0]
+        )
+        request["BlockDeviceMappings"] = get_block_device_map(
+            request["InstanceType"], config.instance_types, True
+        )
+        request.pop("HibernationOptions", None)
+        # the builder is not a node of the cluster, so it does not get the
+        # Muchos tag that the instances of the cluster are looked up by
+        builder_tags = [
+            dict(tag, Key="MuchosBuilder") if tag["Key"] == "Muchos" else tag
+            for tag in self.cluster_tags()
+        ]
+        request["TagSpecifications"] = [
+            {"ResourceType": "instance", "Tags": builder_tags}
+        ]
+        response = self.ec2.run_instances(MinCount=1, MaxCount=1, **request)
+        builder_id = response["Instances"][0]["InstanceId"]
+        self.tag_node(builder_id, hostname)
+        try:
+            instances = self.wait_until_ready({builder_id: hostname}, True)
+            self.provision_builder(instances[builder_id]["PrivateIpAddress"])
+
+            print("Creating image '{0}' from {1}".format(name, hostname))
+            response = self.ec2.create_image(
+                InstanceId=builder_id,
+                Name=name,
+                Description="Muchos image for {0}".format(
+                    ", ".join(
+                        "{0} {1}".format(software, config.version(software))
+                        for software in BAKED_SOFTWARE
+                    )
+                ),
+            )
+            image_id = response["ImageId"]
+            try:
+                self.ec2.get_waiter("image_available").wait(
+                    ImageIds=[image_id],
+                    WaiterConfig={"Delay": 15, "MaxAttempts": 160},
+                )
+            except WaiterError as e:
+                exit(
+                    "ERROR - Image '{0}' ({1}) did not become available:"
+                    "\n{2}".format(name, image_id, e)
+                )
+        finally:
+            self.bulk_call(self.ec2.terminate_instances, [builder_id])
+        print(
+            "Baked image '{0}' ({1}). Nodes of clusters with the same "
+            "software are launched from it".format(name, image_id)
+        )
+
+    def security_group_id(self):
         if self.config.has_option("ec2", "security_group_id"):
-            sg_id = self.config.get("ec2", "security_group_id")
-        else:
-            sg_id = self.create_security_group()
+            return self.config.get("ec2", "security_group_id")
+        return self.create_security_group()
 
-        instance_d = {}
-        for hostname, services in list(self.config.nodes().items()):
-            instance = self.launch_node(hostname, services, sg_id)
-            instance_d[instance["InstanceId"]] = hostname
+    def add_nodes(self, hostnames):
+        # launches the nodes that are not in the hosts file yet and waits
+        # until they pass status checks, so that they can be set up
+        hosts = self.config.get_hosts()
+        missing = [h for h in hostnames if h not in hosts]
+        if not missing:
+            return
+        self.update_instance_types()
+        self.config.verify_launch()
+        self.verify_architecture(self.config.launch_instance_types())
+        instance_d = self.launch_missing(
+            {h: self.config.get_node(h) for h in missing},
+            self.security_group_id(),
+            list(self.iter_status(ACTIVE_STATES)),
+        )
+        self.invalidate_inventory()
+        instances = self.wait_until_ready(instance_d, True)
+        self.write_hosts_file(instance_d, instances, append=True)
+        print(
+            "Added {0} nodes to hosts file at {1}".format(
+                len(instances), self.config.hosts_path
+            )
+        )
 
-        num_running = len(self.get_status(["running"]))
-        num_expected = len(self.config.nodes())
-        while num_running != num_expected:
+    def remove_nodes(self, hostnames):
+        names = {self.config.cluster_name + "-" + h for h in hostnames}
+        nodes = [
+            node
+            for node in self.iter_status(ACTIVE_STATES)
+            if any(
+                tag["Key"] == "Name" and tag["Value"] in names
+                for tag in node.get("Tags", [])
+            )
+        ]
+        self.bulk_call(self.ec2.terminate_instances, node_ids(nodes))
+        self.invalidate_inventory()
+        self.print_nodes(nodes)
+        print("Terminated {0} nodes.".format(len(nodes)))
+        self.forget_launched(hostnames)
+        super().remove_nodes(hostnames)
+
+    def update_instance_types(self):
+        # looks up selected instance types that are not in the catalog yet
+        # (or all instance types, if --refresh was given) from EC2
+        catalog = self.config.instance_types
+        if self.config.refresh_cache:
+            print("Refreshing catalog of EC2 instance types")
+            catalog.refresh(self.ec2)
+            return
+        # hibernation support is only known for looked up instance types
+        missing = [
+            instance_type
+            for instance_type in self.config.launch_instance_types()
+            if instance_type not in catalog
+            or (
+                self.config.hibernate()
+                and catalog.get(instance_type).hibernation_supported is None
+            )
+        ]
+        if missing:
             print(
-                "{0} of {1} nodes have started. "
-                "Waiting another 5 sec..".format(num_running, num_expected)
+                "Looking up EC2 instance types {0}".format(", ".join(missing))
             )
-            time.sleep(5)
-            num_running = len(self.get_status(["running"]))
+            try:
+                catalog.refresh(self.ec2, missing)
+            except ClientError as e:
+                exit(
+                    "ERROR - Failed to look up EC2 instance types {0} due to "
+                    "exception:\n{1}".format(", ".join(missing), e)
+                )
 
-        with open(self.config.hosts_path, "w") as hosts_file:
-            for instance in self.get_status(["running"]):
+    def write_hosts_file(self, instance_d, instances, append=False):
+        mode = "a" if append else "w"
+        with open(self.config.hosts_path, mode) as hosts_file:
+            for instance_id, instance in sorted(
+                instances.items(), key=lambda i: instance_d[i[0]]
+            ):
                 public_ip = ""
                 if "PublicIpAddress" in instance:
                     public_ip = instance["PublicIpAddress"]
                 private_ip = instance["PrivateIpAddress"]
-                hostname = instance_d[instance["InstanceId"]]
                 print(
-                    "{0} {1} {2}".format(hostname, private_ip, public_ip),
+                    "{0} {1} {2}".format(
+                        instance_d[instance_id], private_ip, public_ip
+                    ),
                     file=hosts_file,
                 )
 
-        print(
-            "All {0} nodes have started. Created hosts file at {1}".format(
-                num_expected, self.config.hosts_path
+    def wait_until_ready(self, instance_d, wait_for_status_ok=False):
+        # only the launched instances are polled. Returns the description of
+        # each instance (keyed by instance ID) once all of them are running
+        # (and pass status checks, if wait_for_status_ok)
+        instances = {}
+
+        def running(instance_ids):
+            found = self.running_instances(instance_ids)
+            instances.update(found)
+            return found.keys()
+
+        for _ in self.iter_ready(instance_d, running, "running"):
+            pass
+
+        if wait_for_status_ok:
+            for _ in self.iter_ready(
+                instance_d,
+                self.status_ok_instances,
+                "passing status checks",
+            ):
+                pass
+        return instances
+
+    def setup_as_ready(self, instance_d):
+        # Sets up a cluster whose nodes are still starting. Each node is
+        # prepared by common.yml (which formats and mounts its disks and
+        # tunes the OS) and has its software installed by install.yml as
+        # soon as it passes status checks, together with any other nodes
+        # that became ready while the previous batch was in progress.
+        # Services are only set up once every node has been prepared.
+        config = self.config
+        print("Setting up {0} cluster".format(config.cluster_name))
+        self.wait_until_proxy_ready()
+        self.sync()
+        self.upload_tarballs()
+
+        # the proxy is reachable, so it is prepared by the first run
+        proxy = config.proxy_hostname()
+        prepared = set()
+        for ready in self.iter_ready(
+            instance_d, self.status_ok_instances, "passing status checks"
+        ):
+            hosts = [instance_d[i] for i in ready]
+            if proxy not in prepared and proxy not in hosts:
+                hosts.insert(0, proxy)
+            hosts = [h for h in hosts if h not in prepared]
+            if hosts:
+                self.execute_playbook("common.yml", limit=hosts)
+                self.execute_playbook("install.yml", limit=hosts)
+                prepared.update(hosts)
+
+        self.execute_playbook("services.yml")
+
+    @staticmethod
+    def iter_ready(instance_d, check, description):
+        # polls the pending instances using check (which returns the IDs of
+        # the given instances that are ready) and yields the IDs of newly
+        # ready instances. The poll interval backs off while no progress is
+        # made and is reset as soon as more instances become ready.
+        pending = set(instance_d)
+        delay = READY_POLL_MIN_DELAY
+        while pending:
+            ready = sorted(
+                set(check(sorted(pending))) & pending,
+                key=lambda i: instance_d[i],
             )
-        )
+            for instance_id in ready:
+                pending.discard(instance_id)
+                print(
+                    "  {0} is {1} ({2} of {3})".format(
+                        instance_d[instance_id],
+                        description,
+                        len(instance_d) - len(pending),
+                        len(instance_d),
+                    )
+                )
+            if ready:
+                yield ready
+                delay = READY_POLL_MIN_DELAY
+            elif pending:
+                delay = min(delay * 1.5, READY_POLL_MAX_DELAY)
+            if pending:
+                time.sleep(delay)
+
+    def running_instances(self, instance_ids):
+        running = {}
+        for ids in chunks(instance_ids, INSTANCE_ID_BATCH_SIZE):
+            response = call_with_backoff(
+                self.ec2.describe_instances,
+                retry_codes=("InvalidInstanceID.NotFound",),
+                InstanceIds=ids,
+            )
+            for res in response["Reservations"]:
+                for inst in res["Instances"]:
+                    state = inst["State"]["Name"]
+                    if state == "running":
+                        running[inst["InstanceId"]] = inst
+                    elif state != "pending":
+                        exit(
+                            "ERROR - Instance {0} entered '{1}' state while "
+                            "waiting for it to start".format(
+                                inst["InstanceId"], state
+                            )
+                        )
+        return running
+
+    def status_ok_instances(self, instance_ids):
+        status_ok = []
+        for ids in chunks(instance_ids, INSTANCE_ID_BATCH_SIZE):
+            response = self.ec2.describe_instance_status(InstanceIds=ids)
+            for status in response["InstanceStatuses"]:
+                if (
+                    status["InstanceStatus"]["Status"] == "ok"
+                    and status["SystemStatus"]["Status"] == "ok"
+                ):
+                    status_ok.append(status["InstanceId"])
+        return status_ok
 
     def status(self):
-        nodes = self.get_status(["running"])
+        print("Running nodes in {0} cluster:".format(self.config.cluster_name))
+        num_nodes = 0
+        for node in self.iter_inventory(
+            lambda: self.iter_status(ACTIVE_STATES)
+        ):
+            if node["State"]["Name"] == "running":
+                self.print_node(node)
+                num_nodes += 1
         print(
             "Found {0} nodes in {1} cluster".format(
-                len(nodes), self.config.cluster_name
+                num_nodes, self.config.cluster_name
             )
         )
-        self.print_nodes(nodes)
 
-    def get_status(self, states):
-        ec2 = boto3.client("ec2")
-        response = ec2.describe_instances(
+    def iter_status(self, states):
+        # instance states are filtered by EC2 and all result pages are
+        # followed. Instances are yielded as each page arrives.
+        paginator = self.ec2.get_paginator("describe_instances")
+        for page in paginator.paginate(
             Filters=[
-                {"Name": "tag:Muchos", "Values": [self.config.cluster_name]}
+                {"Name": "tag:Muchos", "Values": [self.config.cluster_name]},
+                {"Name": "instance-state-name", "Values": list(states)},
             ]
-        )
-        nodes = []
-        for res in response["Reservations"]:
-            for inst in res["Instances"]:
-                if inst["State"]["Name"] in states:
-                    nodes.append(inst)
-        return nodes
+        ):
+            for res in page["Reservations"]:
+                for inst in res["Instances"]:
+                    yield inst
+
+    def get_status(self, states):
+        # reads through the inventory cache, which holds all active nodes
+        return [
+            node
+            for node in self.iter_inventory(
+                lambda: self.iter_status(ACTIVE_STATES)
+            )
+            if node["State"]["Name"] in states
+        ]
 
     def active_nodes(self):
-        return self.get_status(["pending", "running", "stopping", "stopped"])
+        return self.get_status(ACTIVE_STATES)
+
+    @staticmethod
+    def print_node(node):
+        print(
+            "  ",
+            node_name(node) or "Unknown",
+            node["InstanceId"],
+            node.get("PrivateIpAddress", ""),
+            node.get("PublicIpAddress", ""),
+        )
 
     @staticmethod
     def print_nodes(nodes):
         for node in nodes:
-            name = "Unknown"
-            for tag in node["Tags"]:
-                if tag["Key"] == "Name":
-                    name = tag["Value"]
-            print(
-                "  ",
-                name,
-                node["InstanceId"],
-                node["PrivateIpAddress"],
-                node.get("PublicIpAddress", ""),
-            )
+            Ec2Cluster.print_node(node)
+
+    @staticmethod
+    def bulk_call(func, instance_ids, **kwargs):
+        # instance IDs are sent in chunks of the maximum request size using
+        # a few concurrent calls
+        with ThreadPoolExecutor(max_workers=BULK_MAX_WORKERS) as executor:
+            futures = [
+                executor.submit(func, InstanceIds=ids, **kwargs)
+                for ids in chunks(instance_ids, INSTANCE_ID_BATCH_SIZE)
+            ]
+            for future in as_completed(futures):
+                future.result()
 
     def stop(self):
-        nodes = self.active_nodes()
+        # with hibernate, nodes keep the contents of their memory (and the
+        # caches of their services) while they are stopped
+        hibernate = self.config.hibernate()
+        nodes = without_spot(
+            self.iter_status(["pending", "running"]),
+            "hibernated" if hibernate else "stopped",
+        )
         print(
             "The following {0} nodes in {1} cluster "
-            "will be stopped:".format(len(nodes), self.config.cluster_name)
+            "will be {2}:".format(
+                len(nodes),
+                self.config.cluster_name,
+                "hibernated" if hibernate else "stopped",
+            )
         )
-        ec2 = boto3.client("ec2")
-        for node in nodes:
-            ec2.stop_instances(InstanceIds=[node["InstanceId"]])
+        self.bulk_call(
+            self.ec2.stop_instances, node_ids(nodes), Hibernate=hibernate
+        )
+        self.invalidate_inventory()
         self.print_nodes(nodes)
-        print("Stopped nodes.")
+        print("Hibernated nodes." if hibernate else "Stopped nodes.")
 
     def start(self):
-        nodes = self.active_nodes()
+        nodes = without_spot(self.iter_status(["stopped"]), "started")
         print(
             "The following {0} nodes in {1} cluster "
             "will be started:".format(len(nodes), self.config.cluster_name)
         )
-        ec2 = boto3.client("ec2")
-        for node in nodes:
-            ec2.start_instances(InstanceIds=[node["InstanceId"]])
+        self.bulk_call(self.ec2.start_instances, node_ids(nodes))
+        self.invalidate_inventory()
         self.print_nodes(nodes)
         print("Started nodes.")
+        if nodes and path.isfile(self.config.hosts_path):
+            self.update_public_ips(nodes)
+
+    def update_public_ips(self, nodes):
+        # nodes get new public IPs when they are started again, so they are
+        # updated in the hosts file once the nodes are running
+        prefix = self.config.cluster_name + "-"
+        hosts = self.config.get_hosts()
+        instance_d = {}
+        for node in nodes:
+            for tag in node.get("Tags", []):
+                if tag["Key"] == "Name" and tag["Value"].startswith(prefix):
+                    hostname = tag["Value"][len(prefix):]
+                    if hostname in hosts:
+                        instance_d[node["InstanceId"]] = hostname
+        instances = self.wait_until_ready(instance_d)
+        for instance_id, instance in instances.items():
+            hostname = instance_d[instance_id]
+            hosts[hostname] = (
+                hosts[hostname][0],
+                instance.get("PublicIpAddress"),
+            )
+        with open(self.config.hosts_path, "w") as hosts_file:
+            for hostname, (private_ip, public_ip) in hosts.items():
+                print(
+                    "{0} {1} {2}".format(
+                        hostname, private_ip, public_ip or ""
+                    ).strip(),
+                    file=hosts_file,
+                )
+        print(
+            "Updated public IPs in hosts file at {0}".format(
+                self.config.hosts_path
+            )
+        )
 
     def terminate(self):
-        nodes = self.active_nodes()
+        nodes = list(self.iter_status(ACTIVE_STATES))
         print(
             "The following {0} nodes in {1} cluster "
             "will be terminated:".format(len(nodes), self.config.cluster_name)
@@ -334,27 +1389,85 @@ class Ec2Cluster(ExistingCluster):
 
         response = input("Do you want to continue? (y/n) ")
         if response == "y":
-            ec2 = boto3.client("ec2")
-            for node in nodes:
-                ec2.terminate_instances(InstanceIds=[node["InstanceId"]])
+            self.bulk_call(self.ec2.terminate_instances, node_ids(nodes))
+            self.invalidate_inventory()
 
             print("Terminated nodes.")
-            if not self.config.has_option("ec2", "security_group_id"):
+            delete_sg = not self.config.has_option("ec2", "security_group_id")
+            delete_pg = self.config.placement_strategy() is not None
+            # the security and placement groups can only be deleted once
+            # the instances using them are gone
+            if nodes and (delete_sg or delete_pg):
+                self.wait_until_terminated(node_ids(nodes))
+            if delete_sg:
                 self.delete_security_group()
+            if delete_pg:
+                self.delete_placement_group()
+            # registered launch templates, and temporary EC2 Fleet launch
+            # templates left by a killed launch
+            self.delete_launch_templates()
 
             if path.isfile(self.config.hosts_path):
                 os.remove(self.config.hosts_path)
                 print("Removed hosts file at ", self.config.hosts_path)
+            self.journal.invalidate(self.config.cluster_name)
         else:
             print("Aborted termination")
 
+    def delete_launch_templates(self):
+        paginator = self.ec2.get_paginator("describe_launch_templates")
+        for page in paginator.paginate(
+            Filters=[
+                {"Name": "tag:Muchos", "Values": [self.config.cluster_name]}
+            ]
+        ):
+            for template in page["LaunchTemplates"]:
+                self.ec2.delete_launch_template(
+                    LaunchTemplateId=template["LaunchTemplateId"]
+                )
+                print(
+                    "Deleted launch template '{0}'".format(
+                        template["LaunchTemplateName"]
+                    )
+                )
+
     def wipe(self):
         super().wipe()
 
+    def verify_proxy_running(self):
+        # ssh and sync check the proxy against the inventory instead of
+        # trusting the hosts file. As the inventory is cached, a loop of
+        # commands does not look up the instances for every command.
+        proxy = self.config.proxy_hostname()
+        name = self.config.cluster_name + "-" + proxy
+        for node in self.active_nodes():
+            if node_name(node) == name:
+                if node["State"]["Name"] != "running":
+                    exit(
+                        "ERROR - Proxy {0} is {1}. Start the cluster "
+                        "first".format(proxy, node["State"]["Name"])
+                    )
+                return
+        exit(
+            "ERROR - Proxy {0} of {1} cluster is not running. Use --refresh "
+            "if it was launched recently".format(
+                proxy, self.config.cluster_name
+            )
+        )
+
+    def perform(self, action):
+        if action in ("ssh", "sync") and path.isfile(self.config.hosts_path):
+            self.verify_proxy_running()
+        super().perform(action)
+        if self._ec2 is not None and self.config.print_api_stats():
+            self._ec2.print_stats()
+
 
 class Ec2ClusterTemplate(Ec2Cluster):
     def __init__(self, config):
         Ec2Cluster.__init__(self, config)
+        # launch requests compiled from the cluster template, by service
+        self.template_requests = {}
 
     def launch(self):
         print(
@@ -367,11 +1480,71 @@ class Ec2ClusterTemplate(Ec2Cluster):
     def init_request(self, hostname, services, sg_id):
         # the first service in the list denotes the node's target template
         print("Template '{0}' selected for {1}".format(services[0], hostname))
+        if services[0] not in self.template_requests:
+            self.template_requests[services[0]] = self.compile_template(
+                services[0], sg_id
+            )
+        return self.template_requests[services[0]]
+
+    def compile_template(self, service, sg_id):
         # interpolate any values from the ec2 config section and create request
         ec2_d = dict(self.config.items("ec2"))
         ec2_d["security_group_id"] = sg_id
-        return json.loads(
-            Template(self.config.cluster_template_d[services[0]]).substitute(
-                ec2_d
+        ec2_d["aws_ami"] = self.image_id()
+        request = json.loads(
+            Template(self.config.cluster_template_d[service]).substitute(ec2_d)
+        )
+        if self.config.use_launch_templates():
+            return {"LaunchTemplate": self.register_template(service, request)}
+        return request
+
+    def register_template(self, service, request):
+        # registers the request as an EC2 launch template (or as a new
+        # version of it, if it exists), so it can be referenced by ID
+        name = "{0}-{1}".format(self.config.cluster_name, service)
+        node_type = "worker" if service == "worker" else "default"
+        data = self.launch_template_data(
+            request, super().user_data(node_type)
+        )
+        try:
+            response = self.ec2.create_launch_template(
+                LaunchTemplateName=name,
+                LaunchTemplateData=data,
+                TagSpecifications=[
+                    {
+                        "ResourceType": "launch-template",
+                        "Tags": self.cluster_tags(),
+                    }
+                ],
+            )
+            template = response["LaunchTemplate"]
+            version = template["LatestVersionNumber"]
+        except ClientError as e:
+            if (
+                e.response["Error"]["Code"]
+                != "InvalidLaunchTemplateName.AlreadyExistsException"
+            ):
+                exit(
+                    "ERROR - Failed to register launch template '{0}' due "
+                    "to exception:\n{1}".format(name, e)
+                )
+            response = self.ec2.create_launch_template_version(
+                LaunchTemplateName=name, LaunchTemplateData=data
+            )
+            template = response["LaunchTemplateVersion"]
+            version = template["VersionNumber"]
+        print(
+            "Registered launch template '{0}' version {1}".format(
+                name, version
             )
         )
+        return {
+            "LaunchTemplateId": template["LaunchTemplateId"],
+            "Version": str(version),
+        }
+
+    def user_data(self, node_type="default"):
+        # user data is part of the registered launch templates
+        if self.config.use_launch_templates():
+            return None
+        return super().user_data(node_type)
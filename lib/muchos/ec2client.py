@@ -0,0 +1,78 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+import time
+import boto3
+from botocore.config import Config
+
+
+# Holds a single boto3 EC2 client that is shared by all threads of a Muchos
+# command. Creating a client resolves credentials, loads the endpoint model
+# and opens new connections, so it should only be done once. boto3 clients
+# (unlike sessions) are thread-safe. The latency of every API call made
+# through the client, including calls made by paginators and waiters, is
+# recorded per operation.
+class Ec2Client(object):
+    def __init__(self, region=None, max_pool_connections=20, max_attempts=10):
+        session = boto3.session.Session(region_name=region)
+        self.client = session.client(
+            "ec2",
+            config=Config(
+                max_pool_connections=max_pool_connections,
+                retries={"mode": "adaptive", "max_attempts": max_attempts},
+            ),
+        )
+        self.lock = threading.Lock()
+        self.latencies = {}
+        events = self.client.meta.events
+        events.register("before-call.ec2", self._before_call)
+        events.register("after-call.ec2", self._after_call)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    @staticmethod
+    def _before_call(context, **kwargs):
+        context["muchos_start_time"] = time.monotonic()
+
+    def _after_call(self, model, context, **kwargs):
+        start = context.get("muchos_start_time")
+        if start is None:
+            return
+        elapsed = time.monotonic() - start
+        with self.lock:
+            calls, total, slowest = self.latencies.get(model.name, (0, 0, 0))
+            self.latencies[model.name] = (
+                calls + 1,
+                total + elapsed,
+                max(slowest, elapsed),
+            )
+
+    def stats(self):
+        # returns {operation: (calls, total seconds, slowest call seconds)}
+        with self.lock:
+            return dict(self.latencies)
+
+    def print_stats(self):
+        print("EC2 API calls (operation, calls, total sec, max sec):")
+        for name, (calls, total, slowest) in sorted(self.stats().items()):
+            print(
+                "   {0} {1} {2:.3f} {3:.3f}".format(
+                    name, calls, total, slowest
+                )
+            )
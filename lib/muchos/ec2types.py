@@ -0,0 +1,239 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Catalog of EC2 instance types
+"""
+
+CATALOG_CACHE_KEY = "ec2-instance-types"
+
+
+class EC2Type:
+    def __init__(
+        self,
+        arch,
+        ephemeral=1,
+        has_nvme=False,
+        hypervisor="xen",
+        vcpus=None,
+        memory_mib=None,
+        disk_size_gb=None,
+        network_performance=None,
+        hibernation_supported=None,
+        architectures=None,
+    ):
+        self.arch = arch
+        self.ephemeral = ephemeral
+        self.has_nvme = has_nvme
+        self.hypervisor = hypervisor
+        self.vcpus = vcpus
+        self.memory_mib = memory_mib
+        self.disk_size_gb = disk_size_gb
+        self.network_performance = network_performance
+        # None if it is not known yet whether the type supports hibernation
+        self.hibernation_supported = hibernation_supported
+        # processor architectures of the images the type can run
+        self.architectures = list(architectures or ["x86_64"])
+
+    @property
+    def nvme_start(self):
+        # On Nitro instances, the EBS root volume is the first NVMe device,
+        # so instance store devices are numbered from 1
+        return 0 if self.hypervisor == "xen" else 1
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @staticmethod
+    def from_dict(d):
+        return EC2Type(**d)
+
+    @staticmethod
+    def from_description(d):
+        # converts an item returned by EC2 describe_instance_types
+        storage = d.get("InstanceStorageInfo", {})
+        disks = storage.get("Disks", [])
+        return EC2Type(
+            "hvm" if "hvm" in d["SupportedVirtualizationTypes"] else "pvm",
+            ephemeral=sum(disk["Count"] for disk in disks),
+            has_nvme=len(disks) > 0
+            and storage.get("NvmeSupport", "unsupported") != "unsupported",
+            hypervisor=d.get("Hypervisor", "nitro"),
+            vcpus=d["VCpuInfo"]["DefaultVCpus"],
+            memory_mib=d["MemoryInfo"]["SizeInMiB"],
+            disk_size_gb=disks[0]["SizeInGB"] if disks else None,
+            network_performance=d["NetworkInfo"]["NetworkPerformance"],
+            hibernation_supported=d.get("HibernationSupported", False),
+            architectures=d.get("ProcessorInfo", {}).get(
+                "SupportedArchitectures"
+            ),
+        )
+
+
+# The network performance and hibernation support of seed types are left
+# unknown (None). When hibernate is set, types whose hibernation support is
+# unknown are looked up from EC2 before the launch is verified.
+def _nitro(ephemeral, vcpus, memory_gib, disk_size_gb, architectures=None):
+    return EC2Type(
+        "hvm",
+        ephemeral,
+        True,
+        "nitro",
+        vcpus=vcpus,
+        memory_mib=memory_gib * 1024,
+        disk_size_gb=disk_size_gb,
+        architectures=architectures,
+    )
+
+
+# Graviton instance types only run arm64 images
+_ARM64 = ["arm64"]
+
+# instance types that are known without looking them up from EC2
+_SEED_TYPES = {
+    "c1.medium": EC2Type("pvm"),
+    "c1.xlarge": EC2Type("pvm", 4),
+    "c3.2xlarge": EC2Type("pvm", 2),
+    "c3.4xlarge": EC2Type("pvm", 2),
+    "c3.8xlarge": EC2Type("pvm", 2),
+    "c3.large": EC2Type("pvm", 2),
+    "c3.xlarge": EC2Type("pvm", 2),
+    "cc2.8xlarge": EC2Type("hvm", 4),
+    "cg1.4xlarge": EC2Type("hvm", 2),
+    "cr1.8xlarge": EC2Type("hvm", 2),
+    "hi1.4xlarge": EC2Type("pvm", 2),
+    "hs1.8xlarge": EC2Type("pvm", 24),
+    "i2.2xlarge": EC2Type("hvm", 2),
+    "i2.4xlarge": EC2Type("hvm", 4),
+    "i2.8xlarge": EC2Type("hvm", 8),
+    "i2.xlarge": EC2Type("hvm"),
+    "i3.large": EC2Type("hvm", 1, True),
+    "i3.xlarge": EC2Type("hvm", 1, True),
+    "i3.2xlarge": EC2Type("hvm", 1, True),
+    "i3.4xlarge": EC2Type("hvm", 2, True),
+    "c6gd.medium": _nitro(1, 1, 2, 59, _ARM64),
+    "c6gd.large": _nitro(1, 2, 4, 118, _ARM64),
+    "c6gd.xlarge": _nitro(1, 4, 8, 237, _ARM64),
+    "c6gd.2xlarge": _nitro(1, 8, 16, 474, _ARM64),
+    "c6gd.4xlarge": _nitro(1, 16, 32, 950, _ARM64),
+    "c6gd.8xlarge": _nitro(1, 32, 64, 1900, _ARM64),
+    "c6gd.12xlarge": _nitro(2, 48, 96, 1425, _ARM64),
+    "c6gd.16xlarge": _nitro(2, 64, 128, 1900, _ARM64),
+    "i3en.large": _nitro(1, 2, 16, 1250),
+    "i3en.xlarge": _nitro(1, 4, 32, 2500),
+    "i3en.2xlarge": _nitro(2, 8, 64, 2500),
+    "i3en.3xlarge": _nitro(1, 12, 96, 7500),
+    "i3en.6xlarge": _nitro(2, 24, 192, 7500),
+    "i3en.12xlarge": _nitro(4, 48, 384, 7500),
+    "i3en.24xlarge": _nitro(8, 96, 768, 7500),
+    "i4i.large": _nitro(1, 2, 16, 468),
+    "i4i.xlarge": _nitro(1, 4, 32, 937),
+    "i4i.2xlarge": _nitro(1, 8, 64, 1875),
+    "i4i.4xlarge": _nitro(1, 16, 128, 3750),
+    "i4i.8xlarge": _nitro(2, 32, 256, 3750),
+    "i4i.16xlarge": _nitro(4, 64, 512, 3750),
+    "i4i.32xlarge": _nitro(8, 128, 1024, 3750),
+    "m1.large": EC2Type("pvm", 2),
+    "m1.medium": EC2Type("pvm"),
+    "m1.small": EC2Type("pvm"),
+    "m1.xlarge": EC2Type("pvm", 4),
+    "m2.2xlarge": EC2Type("pvm", 1),
+    "m2.4xlarge": EC2Type("pvm", 2),
+    "m2.xlarge": EC2Type("pvm"),
+    "m3.2xlarge": EC2Type("hvm", 2),
+    "m3.large": EC2Type("hvm"),
+    "m3.medium": EC2Type("hvm"),
+    "m3.xlarge": EC2Type("hvm", 2),
+    "m5d.large": EC2Type("hvm", 1, True, "nitro"),
+    "m5d.xlarge": EC2Type("hvm", 1, True, "nitro"),
+    "m5d.2xlarge": EC2Type("hvm", 1, True, "nitro"),
+    "m5d.4xlarge": EC2Type("hvm", 2, True, "nitro"),
+    "m5d.12xlarge": EC2Type("hvm", 2, True, "nitro"),
+    "m5d.24xlarge": EC2Type("hvm", 4, True, "nitro"),
+    "m6id.large": _nitro(1, 2, 8, 118),
+    "m6id.xlarge": _nitro(1, 4, 16, 237),
+    "m6id.2xlarge": _nitro(1, 8, 32, 474),
+    "m6id.4xlarge": _nitro(1, 16, 64, 950),
+    "m6id.8xlarge": _nitro(1, 32, 128, 1900),
+    "m6id.12xlarge": _nitro(2, 48, 192, 1425),
+    "m6id.16xlarge": _nitro(2, 64, 256, 1900),
+    "m6id.24xlarge": _nitro(4, 96, 384, 1425),
+    "m6id.32xlarge": _nitro(4, 128, 512, 1900),
+    "r3.2xlarge": EC2Type("hvm", 1),
+    "r3.4xlarge": EC2Type("hvm", 1),
+    "r3.8xlarge": EC2Type("hvm", 2),
+    "r3.large": EC2Type("hvm", 1),
+    "r3.xlarge": EC2Type("hvm", 1),
+    "r6id.large": _nitro(1, 2, 16, 118),
+    "r6id.xlarge": _nitro(1, 4, 32, 237),
+    "r6id.2xlarge": _nitro(1, 8, 64, 474),
+    "r6id.4xlarge": _nitro(1, 16, 128, 950),
+    "r6id.8xlarge": _nitro(1, 32, 256, 1900),
+    "r6id.12xlarge": _nitro(2, 48, 384, 1425),
+    "r6id.16xlarge": _nitro(2, 64, 512, 1900),
+    "r6id.24xlarge": _nitro(4, 96, 768, 1425),
+    "r6id.32xlarge": _nitro(4, 128, 1024, 1900),
+    "d2.xlarge": EC2Type("hvm", 3),
+    "d2.2xlarge": EC2Type("hvm", 6),
+    "d2.4xlarge": EC2Type("hvm", 12),
+    "d2.8xlarge": EC2Type("hvm", 24),
+}
+
+
+class InstanceTypeCatalog(object):
+    # Starts out with the seed instance types, plus any instance types that
+    # were previously looked up from EC2 and stored in the (optional) cache.
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.types = dict(_SEED_TYPES)
+        if cache is not None:
+            cached = cache.get(CATALOG_CACHE_KEY, None) or {}
+            for name, d in cached.items():
+                self.types[name] = EC2Type.from_dict(d)
+
+    def __contains__(self, instance_type):
+        return instance_type in self.types
+
+    def __iter__(self):
+        return iter(sorted(self.types))
+
+    def get(self, instance_type):
+        return self.types.get(instance_type)
+
+    def refresh(self, ec2, instance_types=None):
+        # looks up the given instance types (or all of them, if None) using
+        # describe_instance_types and stores them in the cache
+        paginator = ec2.get_paginator("describe_instance_types")
+        kwargs = {}
+        if instance_types:
+            kwargs["InstanceTypes"] = list(instance_types)
+        found = {}
+        for page in paginator.paginate(**kwargs):
+            for d in page["InstanceTypes"]:
+                found[d["InstanceType"]] = EC2Type.from_description(d)
+        self.types.update(found)
+
+        if self.cache is not None:
+            cached = self.cache.get(CATALOG_CACHE_KEY, None) or {}
+            for name, ec2_type in found.items():
+                cached[name] = ec2_type.to_dict()
+            self.cache.put(CATALOG_CACHE_KEY, cached)
+        return found
+
+
+# catalog of the seed instance types, used when no other catalog is given
+seed_catalog = InstanceTypeCatalog()
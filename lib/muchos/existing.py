@@ -22,11 +22,32 @@ import time
 from os import path
 from sys import exit
 from os import listdir
+from .cache import FileCache
 
 
 class ExistingCluster:
     def __init__(self, config):
         self.config = config
+        self.cache = FileCache(config.cache_dir())
+
+    def iter_inventory(self, lookup):
+        # yields the cluster inventory from the on-disk cache, unless it is
+        # stale or --refresh was given. Otherwise, the items yielded by
+        # lookup() are passed through and cached once all were read.
+        key = "inventory-" + self.config.cluster_name
+        if not self.config.refresh_cache:
+            inventory = self.cache.get(key, self.config.inventory_cache_ttl())
+            if inventory is not None:
+                yield from inventory
+                return
+        inventory = []
+        for item in lookup():
+            inventory.append(item)
+            yield item
+        self.cache.put(key, inventory)
+
+    def invalidate_inventory(self):
+        self.cache.invalidate("inventory-" + self.config.cluster_name)
 
     def launch(self):
         exit(
@@ -34,7 +55,9 @@ class ExistingCluster:
             "when cluster_type is set to 'existing'"
         )
 
-    def sync(self):
+    def sync(self, new_workers=(), removed_workers=()):
+        # new_workers and removed_workers are written to the inventory as
+        # groups of the same name, for use by grow.yml and shrink.yml
         config = self.config
         print(
             "Syncing ansible directory on {0} cluster proxy node".format(
@@ -54,7 +77,13 @@ class ExistingCluster:
             path.join(config.deploy_path, "ansible/site.yml"), "w"
         ) as site_file:
             print("- import_playbook: common.yml", file=site_file)
+            print("- import_playbook: services.yml", file=site_file)
 
+        # services.yml sets up services once common.yml has prepared every
+        # node, which lets 'launch --setup' prepare nodes as they start
+        with open(
+            path.join(config.deploy_path, "ansible/services.yml"), "w"
+        ) as site_file:
             print("- import_playbook: zookeeper.yml", file=site_file)
             print("- import_playbook: hadoop.yml", file=site_file)
 
@@ -152,6 +181,14 @@ class ExistingCluster:
             for worker_host in config.get_service_hostnames("worker"):
                 print(worker_host, file=hosts_file)
 
+            print("\n[new_workers]", file=hosts_file)
+            for worker_host in sorted(new_workers):
+                print(worker_host, file=hosts_file)
+
+            print("\n[removed_workers]", file=hosts_file)
+            for worker_host in sorted(removed_workers):
+                print(worker_host, file=hosts_file)
+
             print(
                 "\n[accumulo:children]\naccumulomaster\nworkers",
                 file=hosts_file,
@@ -164,9 +201,15 @@ class ExistingCluster:
 
             print("\n[nodes]", file=hosts_file)
             for private_ip, hostname in config.get_private_ip_hostnames():
+                # removed workers are no longer listed in [nodes]
+                node_type = (
+                    "worker"
+                    if hostname in removed_workers
+                    else config.node_type(hostname)
+                )
                 print(
                     "{0} ansible_ssh_host={1} node_type={2}".format(
-                        hostname, private_ip, config.node_type(hostname)
+                        hostname, private_ip, node_type
                     ),
                     file=hosts_file,
                 )
@@ -218,7 +261,11 @@ class ExistingCluster:
         print("Setting up {0} cluster".format(config.cluster_name))
 
         self.sync()
+        self.upload_tarballs()
+        self.execute_playbook("site.yml")
 
+    def upload_tarballs(self):
+        config = self.config
         conf_upload = path.join(config.deploy_path, "conf/upload")
         cluster_tarballs = "{0}/tarballs".format(config.user_home())
         self.exec_on_proxy_verified("mkdir -p {0}".format(cluster_tarballs))
@@ -227,7 +274,166 @@ class ExistingCluster:
             if path.isfile(tarball_path) and tarball_path.endswith("gz"):
                 self.send_to_proxy(tarball_path, cluster_tarballs)
 
-        self.execute_playbook("site.yml")
+    def inventory_group(self, group):
+        # returns the hosts of a group in the ansible inventory written by
+        # the last sync
+        inventory_path = path.join(
+            self.config.deploy_path, "ansible/conf/hosts"
+        )
+        if not path.isfile(inventory_path):
+            exit(
+                "ERROR - {0} cluster has not been set up yet. Run "
+                "'muchos setup' first".format(self.config.cluster_name)
+            )
+        hosts = []
+        in_group = False
+        with open(inventory_path) as inventory_file:
+            for line in inventory_file:
+                line = line.strip()
+                if line.startswith("["):
+                    in_group = line == "[{0}]".format(group)
+                elif in_group and line:
+                    hosts.append(line.split(" ")[0])
+        return hosts
+
+    def worker_changes(self):
+        # Compares the workers of the running cluster (as of the last sync)
+        # with [nodes] and returns the (new, removed) workers. Workers that
+        # were being added or removed by an interrupted grow or shrink are
+        # returned again, so that it can be repeated.
+        config = self.config
+        established = (
+            set(self.inventory_group("workers"))
+            | set(self.inventory_group("removed_workers"))
+        ) - set(self.inventory_group("new_workers"))
+        new_workers = []
+        for hostname in config.get_service_hostnames("worker"):
+            if hostname in established:
+                continue
+            if config.get_node(hostname) != ["worker"]:
+                exit(
+                    "ERROR - New node {0} can only run the 'worker' "
+                    "service".format(hostname)
+                )
+            new_workers.append(hostname)
+        removed_workers = []
+        for hostname in sorted(established):
+            if hostname in config.nodes():
+                if "worker" not in config.get_node(hostname):
+                    exit(
+                        "ERROR - Node {0} no longer runs the 'worker' "
+                        "service. Remove it from [nodes] to remove it "
+                        "from the cluster".format(hostname)
+                    )
+            elif hostname == config.proxy_hostname():
+                exit(
+                    "ERROR - The proxy {0} cannot be removed".format(hostname)
+                )
+            else:
+                removed_workers.append(hostname)
+        return new_workers, removed_workers
+
+    def grow(self):
+        # adds the workers in [nodes] that are not part of the cluster yet,
+        # without restarting any services on the other nodes
+        config = self.config
+        new_workers, _ = self.worker_changes()
+        if not new_workers:
+            print("No new workers were added to [nodes] in muchos.props")
+            return
+        print(
+            "Adding {0} workers to {1} cluster: {2}".format(
+                len(new_workers), config.cluster_name, ", ".join(new_workers)
+            )
+        )
+        self.add_nodes(new_workers)
+        config.hosts = None
+        self.sync(new_workers=new_workers)
+        self.execute_playbook("grow.yml")
+        self.sync()
+
+    def shrink(self):
+        # decommissions and removes the workers of the cluster that were
+        # removed from [nodes]
+        config = self.config
+        _, removed_workers = self.worker_changes()
+        if not removed_workers:
+            print("No workers were removed from [nodes] in muchos.props")
+            return
+        missing = [h for h in removed_workers if h not in config.get_hosts()]
+        if missing:
+            exit(
+                "ERROR - Workers {0} must stay in the hosts file at {1} "
+                "until they are removed".format(
+                    ", ".join(missing), config.hosts_path
+                )
+            )
+        print(
+            "The following {0} workers will be decommissioned and removed "
+            "from {1} cluster: {2}".format(
+                len(removed_workers),
+                config.cluster_name,
+                ", ".join(removed_workers),
+            )
+        )
+        response = input("Do you want to continue? (y/n) ")
+        if response != "y":
+            print("Aborted removal")
+            return
+        self.sync(removed_workers=removed_workers)
+        self.execute_playbook("shrink.yml")
+        self.remove_nodes(removed_workers)
+        config.hosts = None
+        self.sync()
+
+    def add_nodes(self, hostnames):
+        # nodes of existing clusters must already be in the hosts file
+        hosts = self.config.get_hosts()
+        missing = [h for h in hostnames if h not in hosts]
+        if missing:
+            exit(
+                "ERROR - Nodes {0} must be added to the hosts file at "
+                "{1}".format(", ".join(missing), self.config.hosts_path)
+            )
+
+    def remove_nodes(self, hostnames):
+        with open(self.config.hosts_path) as hosts_file:
+            lines = hosts_file.readlines()
+        with open(self.config.hosts_path, "w") as hosts_file:
+            for line in lines:
+                if line.strip().split(" ")[0] not in hostnames:
+                    hosts_file.write(line)
+        print(
+            "Removed {0} from hosts file at {1}".format(
+                ", ".join(hostnames), self.config.hosts_path
+            )
+        )
+
+    @staticmethod
+    def bake():
+        exit(
+            "ERROR - 'bake' command cannot be used "
+            "when cluster_type is set to 'existing'"
+        )
+
+    def verify_bake(self):
+        if not path.isfile(self.config.hosts_path):
+            exit(
+                "ERROR - {0} cluster must be launched before an image can be "
+                "baked, as its proxy provisions the image builder".format(
+                    self.config.cluster_name
+                )
+            )
+
+    def provision_builder(self, builder_ip):
+        # installs the software of the cluster on the image builder at
+        # builder_ip, using the proxy of the cluster
+        self.wait_until_proxy_ready()
+        self.sync()
+        self.upload_tarballs()
+        self.execute_playbook(
+            "bake.yml", extra_vars={"builder_ip": builder_ip}
+        )
 
     @staticmethod
     def status():
@@ -321,20 +527,35 @@ class ExistingCluster:
             )
             time.sleep(5)
 
-    def execute_playbook(self, playbook):
-        print("Executing '{0}' playbook".format(playbook))
+    def execute_playbook(self, playbook, limit=None, extra_vars=None):
+        # limit restricts the playbook to the given list of hosts
+        if limit:
+            print(
+                "Executing '{0}' playbook on {1}".format(
+                    playbook, ", ".join(limit)
+                )
+            )
+        else:
+            print("Executing '{0}' playbook".format(playbook))
         azure_proxy_host = self.config.get("azure", "azure_proxy_host")
         var_azure_proxy_host = (
             "_"
             if (azure_proxy_host is None or azure_proxy_host.strip() == "")
             else azure_proxy_host
         )
+        extra = "".join(
+            " {0}={1}".format(name, value)
+            for name, value in sorted((extra_vars or {}).items())
+        )
         self.exec_on_proxy_verified(
             "time -p ansible-playbook {base}/ansible/{playbook} "
-            "--extra-vars 'azure_proxy_host={var_azure_proxy_host}'".format(
+            "--extra-vars 'azure_proxy_host={var_azure_proxy_host}{extra}'"
+            "{limit}".format(
                 base=self.config.user_home(),
                 playbook=playbook,
                 var_azure_proxy_host=var_azure_proxy_host,
+                extra=extra,
+                limit=" --limit " + ",".join(limit) if limit else "",
             ),
             opts="-t",
         )
@@ -358,6 +579,30 @@ class ExistingCluster:
             shell=True,
         )
 
+    def start_services(self):
+        # only runs the start tasks of the services (and not their setup),
+        # e.g. to bring back a cluster whose nodes were stopped
+        if not path.isfile(self.config.hosts_path):
+            exit(
+                "Hosts file does not exist for cluster: "
+                + self.config.hosts_path
+            )
+        print(
+            "Starting services of {0} cluster".format(self.config.cluster_name)
+        )
+        self.execute_playbook("services-start.yml")
+
+    def stop_services(self):
+        if not path.isfile(self.config.hosts_path):
+            exit(
+                "Hosts file does not exist for cluster: "
+                + self.config.hosts_path
+            )
+        print(
+            "Stopping services of {0} cluster".format(self.config.cluster_name)
+        )
+        self.execute_playbook("services-stop.yml")
+
     def wipe(self):
         if not path.isfile(self.config.hosts_path):
             exit(
@@ -409,5 +654,15 @@ class ExistingCluster:
             self.execute_playbook(action + ".yml")
         elif action == "terminate":
             self.terminate()
+        elif action == "grow":
+            self.grow()
+        elif action == "shrink":
+            self.shrink()
+        elif action == "bake":
+            self.bake()
+        elif action == "services-start":
+            self.start_services()
+        elif action == "services-stop":
+            self.stop_services()
         else:
             print("ERROR - Unknown action:", action)
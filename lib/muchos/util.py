@@ -23,13 +23,7 @@ import os
 import sys
 from os.path import isfile, join
 from optparse import OptionParser
-
-
-class EC2Type:
-    def __init__(self, arch, ephemeral=1, has_nvme=False):
-        self.arch = arch
-        self.ephemeral = ephemeral
-        self.has_nvme = has_nvme
+from .ec2types import seed_catalog
 
 
 AMI_HELP_MSG = """PLEASE NOTE - If you have accepted the software terms for the selected AMI and still get an error,
@@ -42,82 +36,50 @@ The Fedora Project also makes available AMIs for their Fedora Cloud releases. Th
 can be viewed at https://fedoraproject.org/cloud/download and clicking on the AWS link."
 """  # noqa
 
-instance_types = {
-    "c1.medium": EC2Type("pvm"),
-    "c1.xlarge": EC2Type("pvm", 4),
-    "c3.2xlarge": EC2Type("pvm", 2),
-    "c3.4xlarge": EC2Type("pvm", 2),
-    "c3.8xlarge": EC2Type("pvm", 2),
-    "c3.large": EC2Type("pvm", 2),
-    "c3.xlarge": EC2Type("pvm", 2),
-    "cc2.8xlarge": EC2Type("hvm", 4),
-    "cg1.4xlarge": EC2Type("hvm", 2),
-    "cr1.8xlarge": EC2Type("hvm", 2),
-    "hi1.4xlarge": EC2Type("pvm", 2),
-    "hs1.8xlarge": EC2Type("pvm", 24),
-    "i2.2xlarge": EC2Type("hvm", 2),
-    "i2.4xlarge": EC2Type("hvm", 4),
-    "i2.8xlarge": EC2Type("hvm", 8),
-    "i2.xlarge": EC2Type("hvm"),
-    "i3.large": EC2Type("hvm", 1, True),
-    "i3.xlarge": EC2Type("hvm", 1, True),
-    "i3.2xlarge": EC2Type("hvm", 1, True),
-    "i3.4xlarge": EC2Type("hvm", 2, True),
-    "m1.large": EC2Type("pvm", 2),
-    "m1.medium": EC2Type("pvm"),
-    "m1.small": EC2Type("pvm"),
-    "m1.xlarge": EC2Type("pvm", 4),
-    "m2.2xlarge": EC2Type("pvm", 1),
-    "m2.4xlarge": EC2Type("pvm", 2),
-    "m2.xlarge": EC2Type("pvm"),
-    "m3.2xlarge": EC2Type("hvm", 2),
-    "m3.large": EC2Type("hvm"),
-    "m3.medium": EC2Type("hvm"),
-    "m3.xlarge": EC2Type("hvm", 2),
-    "m5d.large": EC2Type("hvm", 1, True),
-    "m5d.xlarge": EC2Type("hvm", 1, True),
-    "m5d.2xlarge": EC2Type("hvm", 1, True),
-    "m5d.4xlarge": EC2Type("hvm", 2, True),
-    "m5d.12xlarge": EC2Type("hvm", 2, True),
-    "m5d.24xlarge": EC2Type("hvm", 4, True),
-    "r3.2xlarge": EC2Type("hvm", 1),
-    "r3.4xlarge": EC2Type("hvm", 1),
-    "r3.8xlarge": EC2Type("hvm", 2),
-    "r3.large": EC2Type("hvm", 1),
-    "r3.xlarge": EC2Type("hvm", 1),
-    "d2.xlarge": EC2Type("hvm", 3),
-    "d2.2xlarge": EC2Type("hvm", 6),
-    "d2.4xlarge": EC2Type("hvm", 12),
-    "d2.8xlarge": EC2Type("hvm", 24),
-}
-
-
-def verify_type(instance_type):
-    if instance_type not in instance_types:
+
+def verify_type(instance_type, catalog=seed_catalog, allow_ebs_only=False):
+    ec2_type = catalog.get(instance_type)
+    if ec2_type is None:
         print(
             "ERROR - EC2 instance type '{}' is currently "
             "not supported!".format(instance_type)
         )
-        print("This is probably due to the instance type being EBS-only.")
+        print(
+            "It could not be found in the catalog of instance types. "
+            "If it is a new instance type, use the --refresh option "
+            "to look it up again."
+        )
         print("Below is a list of supported instance types:")
-        for key in instance_types:
+        for key in catalog:
             print(key)
         sys.exit(1)
+    if ec2_type.ephemeral == 0 and not allow_ebs_only:
+        print(
+            "ERROR - EC2 instance type '{}' is currently "
+            "not supported!".format(instance_type)
+        )
+        print(
+            "This is due to the instance type being EBS-only. Attach EBS "
+            "data volumes to its nodes to use it."
+        )
+        sys.exit(1)
 
 
-def get_arch(instance_type):
-    verify_type(instance_type)
-    return instance_types.get(instance_type).arch
+def get_arch(instance_type, catalog=seed_catalog):
+    verify_type(instance_type, catalog, allow_ebs_only=True)
+    return catalog.get(instance_type).arch
 
 
-def get_ephemeral_devices(instance_type):
-    verify_type(instance_type)
+def get_ephemeral_devices(
+    instance_type, catalog=seed_catalog, allow_ebs_only=False
+):
+    verify_type(instance_type, catalog, allow_ebs_only)
     devices = []
-    ec2_type = instance_types.get(instance_type)
+    ec2_type = catalog.get(instance_type)
 
     start = 0
-    if instance_type.startswith("m5d"):
-        start = 1
+    if ec2_type.has_nvme:
+        start = ec2_type.nvme_start
 
     for i in range(start, ec2_type.ephemeral + start):
         if ec2_type.has_nvme:
@@ -128,12 +90,14 @@ def get_ephemeral_devices(instance_type):
     return devices
 
 
-def get_block_device_map(instance_type):
-    verify_type(instance_type)
+def get_block_device_map(
+    instance_type, catalog=seed_catalog, allow_ebs_only=False
+):
+    verify_type(instance_type, catalog, allow_ebs_only)
 
     bdm = [{"DeviceName": "/dev/sda1", "Ebs": {"DeleteOnTermination": True}}]
 
-    ec2_type = instance_types.get(instance_type)
+    ec2_type = catalog.get(instance_type)
     if not ec2_type.has_nvme:
         for i in range(0, ec2_type.ephemeral):
             device = {
@@ -157,9 +121,14 @@ def parse_args(hosts_dir, input_args=None):
         "Requires '-p'. Use '-p all' for all config.\n"
         + "  stop             Stops instance\n"
         + "  start            Starts instance\n"
+        + "  services-start   Starts services of a set up cluster\n"
+        + "  services-stop    Stops services of cluster\n"
         + "  ssh              SSH to cluster proxy node\n"
         + "  kill             Kills processes on cluster started by Muchos\n"
         + "  wipe             Wipes cluster data and kills processes\n"
+        + "  grow             Add the new workers in [nodes] to cluster\n"
+        + "  shrink           Remove the workers missing from [nodes]\n"
+        + "  bake             Bake an image with the software of cluster\n"
         + "  terminate        Terminate EC2 cluster\n"
         + "  cancel_shutdown  Cancels automatic shutdown of EC2 cluster",
         add_help_option=False,
@@ -174,6 +143,24 @@ def parse_args(hosts_dir, input_args=None):
         help="Specifies property to print (if using 'config' action)"
         ". Set to 'all' to print every property",
     )
+    parser.add_option(
+        "-r",
+        "--refresh",
+        dest="refresh",
+        action="store_true",
+        default=False,
+        help="Ignore cached cloud API results (e.g. the cluster inventory "
+        "used by 'status') and look them up again",
+    )
+    parser.add_option(
+        "-s",
+        "--setup",
+        dest="setup",
+        action="store_true",
+        default=False,
+        help="Set up the cluster after 'launch'. On EC2, nodes are prepared "
+        "as soon as each one is ready",
+    )
     parser.add_option(
         "-h", "--help", action="help", help="Show this help message and exit"
     )
@@ -15,7 +15,17 @@
 # limitations under the License.
 #
 
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+from unittest import mock
+
+from muchos.cache import FileCache
 from muchos.config.azure import AzureDeployConfig
+from muchos.config.azurevalidations import (
+    SKU_LOOKUP_ACTIONS,
+    load_vm_skus,
+    sku_cache_key,
+)
 
 
 def test_azure_cluster():
@@ -50,6 +60,11 @@ def test_azure_cluster():
     assert c.worker_data_dirs() == ["/var/data1", "/var/data2", "/var/data3"]
     assert c.default_data_dirs() == ["/var/data1", "/var/data2", "/var/data3"]
     assert c.metrics_drive_ids() == ["var-data1", "var-data2", "var-data3"]
+    c.set("general", "worker_data_layout", "striped")
+    assert c.worker_data_dirs() == ["/var/data1"]
+    assert c.default_data_dirs() == ["/var/data1", "/var/data2", "/var/data3"]
+    assert c.node_type_map()["worker"] == {"layout": "striped"}
+    c.remove_option("general", "worker_data_layout")
     assert c.shutdown_delay_minutes() == "0"
     assert c.mounts(2) == ["/var/data0", "/var/data1"]
     assert c.node_type("worker1") == "worker"
@@ -126,3 +141,81 @@ def test_azure_cluster():
     ]
 
     # TODO: add test cases for the validations
+
+
+def test_azure_sku_cache():
+    c = AzureDeployConfig(
+        "muchos",
+        "../conf/muchos.props.example",
+        "../conf/hosts/example/example_cluster",
+        "../conf/checksums",
+        "../conf/templates",
+        "mycluster",
+    )
+    with TemporaryDirectory() as tmp_dir:
+        c.deploy_path = tmp_dir
+        # actions which do not create or set up VMs never look up SKUs
+        assert load_vm_skus(c, None, "ssh") == []
+
+        FileCache(c.cache_dir()).put(
+            sku_cache_key(c),
+            [
+                {
+                    "name": "Standard_D8s_v3",
+                    "capabilities": [
+                        ["PremiumIO", "True"],
+                        ["LowPriorityCapable", "False"],
+                        ["MaxDataDiskCount", "16"],
+                    ],
+                }
+            ],
+        )
+        c.vm_skus_for_location = load_vm_skus(c, None, "ssh")
+        assert c.premiumio_capable_skus() == ["Standard_D8s_v3"]
+        assert c.spot_capable_skus() == []
+
+    # SKU capabilities are looked up from an index of typed values
+    assert c.is_known_sku("Standard_D8s_v3")
+    assert c.sku_capabilities("Standard_D8s_v3").max_data_disks == 16
+    assert c.max_data_disks_for_skus() == {"Standard_D8s_v3": 16}
+    assert not c.is_known_sku("Standard_X1")
+    assert not c.sku_capabilities("Standard_X1").premium_io
+
+
+class FakeComputeClient:
+    def __init__(self, credential, subscription_id, api_version):
+        sku = SimpleNamespace(
+            name="Standard_D8s_v3",
+            resource_type="virtualMachines",
+            locations=["westus2"],
+            capabilities=[
+                SimpleNamespace(name="PremiumIO", value="True"),
+                SimpleNamespace(
+                    name="AcceleratedNetworkingEnabled", value="True"
+                ),
+            ],
+        )
+        self.resource_skus = SimpleNamespace(list=lambda: [sku])
+
+
+def test_azure_sku_lookup_for_grow():
+    c = AzureDeployConfig(
+        "muchos",
+        "../conf/muchos.props.example",
+        "../conf/hosts/example/example_cluster",
+        "../conf/checksums",
+        "../conf/templates",
+        "mycluster",
+    )
+    assert "grow" in SKU_LOOKUP_ACTIONS and "bake" in SKU_LOOKUP_ACTIONS
+    with TemporaryDirectory() as tmp_dir:
+        c.deploy_path = tmp_dir
+        # grow creates VMs, so an empty cache is filled from Azure
+        with mock.patch(
+            "muchos.config.azurevalidations.ComputeManagementClient",
+            FakeComputeClient,
+        ):
+            c.vm_skus_for_location = load_vm_skus(c, None, "grow")
+        assert c.premiumio_capable_skus() == ["Standard_D8s_v3"]
+        assert c.accnet_capable_skus() == ["Standard_D8s_v3"]
+        assert FileCache(c.cache_dir()).get(sku_cache_key(c), None)
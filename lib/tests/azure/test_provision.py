@@ -0,0 +1,153 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import asyncio
+import tempfile
+from os import path
+from types import SimpleNamespace
+from unittest import TestCase
+
+from muchos.azureprovision import (
+    Resource,
+    create_all,
+    hostname_ips,
+    image_reference,
+    node_services,
+    write_nodes,
+)
+
+VMSS_ID = (
+    "/subscriptions/sub/resourceGroups/myrg/providers/"
+    "Microsoft.Compute/virtualMachineScaleSets/mycluster"
+)
+
+
+def nic(instance_id, ip):
+    return SimpleNamespace(
+        id=VMSS_ID.lower()
+        + "/virtualMachines/{0}/networkInterfaces/mycluster".format(
+            instance_id
+        ),
+        ip_configurations=[SimpleNamespace(private_ip_address=ip)],
+    )
+
+
+def instance(instance_id):
+    return SimpleNamespace(
+        id=VMSS_ID + "/virtualMachines/{0}".format(instance_id),
+        name="mycluster_{0}".format(instance_id),
+    )
+
+
+class ProvisionTest(TestCase):
+    def test_create_all(self):
+        events = []
+
+        def resource(name, depends_on=()):
+            async def create(created):
+                for dependency in depends_on:
+                    assert dependency in created
+                events.append("start " + name)
+                await asyncio.sleep(0.01)
+                events.append("end " + name)
+                return name.upper()
+
+            return Resource(name, create, depends_on)
+
+        created = asyncio.run(
+            create_all(
+                [
+                    resource("rg"),
+                    resource("vnet", ["rg"]),
+                    resource("ip", ["rg"]),
+                    resource("nic", ["vnet", "ip"]),
+                ]
+            )
+        )
+        self.assertEqual(
+            created, {"rg": "RG", "vnet": "VNET", "ip": "IP", "nic": "NIC"}
+        )
+        # the vnet and public IP are created concurrently
+        self.assertEqual(set(events[2:4]), {"start vnet", "start ip"})
+        self.assertEqual(set(events[4:6]), {"end vnet", "end ip"})
+        self.assertEqual(events[-2:], ["start nic", "end nic"])
+
+        with self.assertRaises(ValueError):
+            asyncio.run(create_all([resource("nic", ["subnet"])]))
+
+    def test_hosts_and_nodes(self):
+        self.assertEqual(
+            image_reference("almalinux-x86_64|almalinux|9-gen2|latest||"),
+            {
+                "offer": "almalinux-x86_64",
+                "publisher": "almalinux",
+                "sku": "9-gen2",
+                "version": "latest",
+            },
+        )
+        self.assertEqual(
+            image_reference("||||/images/baked|"), {"id": "/images/baked"}
+        )
+
+        host_ips = hostname_ips(
+            [instance(i) for i in range(4)],
+            [nic(i, "10.0.0.{0}".format(i + 4)) for i in reversed(range(4))],
+        )
+        self.assertEqual(
+            host_ips,
+            [
+                ("mycluster-0", "10.0.0.4"),
+                ("mycluster-1", "10.0.0.5"),
+                ("mycluster-2", "10.0.0.6"),
+                ("mycluster-3", "10.0.0.7"),
+            ],
+        )
+        hostnames = [hostname for hostname, ip in host_ips]
+        self.assertEqual(
+            node_services(hostnames, "", False),
+            [
+                (
+                    "mycluster-0",
+                    "namenode,resourcemanager,accumulomaster,zookeeper",
+                ),
+                ("mycluster-1", "metrics"),
+                ("mycluster-2", "worker"),
+                ("mycluster-3", "worker"),
+            ],
+        )
+        ha_nodes = node_services(hostnames, "myproxy", True)
+        self.assertEqual(ha_nodes[0], ("myproxy", "client"))
+        self.assertEqual(ha_nodes[3], ("mycluster-2", "journalnode,zookeeper"))
+        self.assertEqual(ha_nodes[4], ("mycluster-3", "worker"))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config_path = path.join(tmp_dir, "muchos.props")
+            with open(config_path, "w") as f:
+                f.write(
+                    "[general]\nproxy_hostname = leader1\n\n"
+                    "[nodes]\nleader1 = namenode\n\n"
+                    "[azure]\nnumnodes = 4\n"
+                )
+            write_nodes(config_path, ha_nodes[:2], "myproxy")
+            with open(config_path) as f:
+                self.assertEqual(
+                    f.read(),
+                    "[general]\nproxy_hostname = myproxy\n\n"
+                    "[azure]\nnumnodes = 4\n\n"
+                    "[nodes]\n#host0 = service\nmyproxy = client\n"
+                    "mycluster-0 = namenode,resourcemanager,accumulomaster,"
+                    "zookeeper,journalnode,zkfc\n",
+                )
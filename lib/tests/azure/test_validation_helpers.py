@@ -0,0 +1,81 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from types import SimpleNamespace
+from unittest import TestCase
+
+from muchos.config.azurevalidationhelpers import (
+    vmss_exists,
+    vmss_provisioning_states,
+    vmss_status_succeeded_if_exists,
+)
+
+
+class FakeScaleSets(object):
+    def __init__(self, states):
+        self.states = states
+        self.calls = []
+
+    def get(self, resource_group_name, vm_scale_set_name):
+        self.calls.append(vm_scale_set_name)
+        if vm_scale_set_name not in self.states:
+            raise Exception("ResourceNotFound")
+        return SimpleNamespace(
+            provisioning_state=self.states[vm_scale_set_name]
+        )
+
+
+class FakeConfig(object):
+    def __init__(self, suffixes):
+        self.cluster_name = "mycluster"
+        self.azure_multiple_vmss_vars = {
+            "vars_list": [{"name_suffix": suffix} for suffix in suffixes]
+        }
+
+    def use_multiple_vmss(self):
+        return True
+
+    def get(self, section, option):
+        return "myrg"
+
+
+class VmssValidationTest(TestCase):
+    def test_multiple_vmss(self):
+        config = FakeConfig(["a", "b", "c"])
+        scale_sets = FakeScaleSets(
+            {"mycluster-a": "Succeeded", "mycluster-b": "Updating"}
+        )
+        client = SimpleNamespace(virtual_machine_scale_sets=scale_sets)
+
+        self.assertEqual(
+            vmss_provisioning_states(config, client),
+            {
+                "mycluster-a": "Succeeded",
+                "mycluster-b": "Updating",
+                "mycluster-c": None,
+            },
+        )
+        self.assertFalse(vmss_status_succeeded_if_exists(config, client))
+        self.assertFalse(vmss_exists(config, client))
+        # each VMSS is only looked up once for all the validations
+        self.assertEqual(len(scale_sets.calls), 3)
+
+        config.vmss_states = None
+        scale_sets.states["mycluster-b"] = "Succeeded"
+        scale_sets.states["mycluster-c"] = "Succeeded"
+        self.assertTrue(vmss_status_succeeded_if_exists(config, client))
+        self.assertTrue(vmss_exists(config, client))
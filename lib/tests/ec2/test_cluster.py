@@ -0,0 +1,372 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from os import path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from botocore.exceptions import ClientError
+
+from muchos.config.ec2 import Ec2DeployConfig
+from muchos.ec2 import Ec2Cluster
+
+
+def instance(instance_id, state="running", name=None):
+    tags = [{"Key": "Muchos", "Value": "mycluster"}]
+    if name is not None:
+        tags.append({"Key": "Name", "Value": name})
+    return {
+        "InstanceId": instance_id,
+        "InstanceType": "m5d.large",
+        "State": {"Name": state},
+        "Tags": tags,
+    }
+
+
+class FakePaginator(object):
+    def __init__(self, instances):
+        self.instances = instances
+
+    def paginate(self, **kwargs):
+        states = kwargs["Filters"][1]["Values"]
+        return [
+            {
+                "Reservations": [
+                    {
+                        "Instances": [
+                            i
+                            for i in self.instances
+                            if i["State"]["Name"] in states
+                        ]
+                    }
+                ]
+            }
+        ]
+
+
+class FakeEc2(object):
+    def __init__(self, instances=()):
+        self.instances = list(instances)
+        self.tags = {}
+
+    def get_paginator(self, name):
+        return FakePaginator(self.instances)
+
+    def create_tags(self, Resources, Tags):
+        for resource in Resources:
+            self.tags[resource] = Tags
+
+
+class LaunchStopped(Exception):
+    pass
+
+
+class Ec2ClusterJournalTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.config = Ec2DeployConfig(
+            "muchos",
+            "../conf/muchos.props.example",
+            "../conf/hosts/example/example_cluster",
+            "../conf/checksums",
+            "../conf/templates",
+            "mycluster",
+        )
+        self.config.deploy_path = self.tmp_dir.name
+        self.config.hosts_path = path.join(self.tmp_dir.name, "mycluster")
+        self.cluster = Ec2Cluster(self.config)
+        self.cluster._ec2 = FakeEc2()
+        self.launched = []
+        self.cluster.launch_nodes = self.fake_launch_nodes
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def fake_launch_nodes(self, nodes, sg_id):
+        # launches an instance for each node, recording it like launch_group
+        batch = [
+            (instance("i-new-" + hostname), hostname)
+            for hostname in sorted(nodes)
+        ]
+        self.cluster.record_launched(batch)
+        self.launched.extend(sorted(nodes))
+        return {i["InstanceId"]: hostname for i, hostname in batch}
+
+    def test_record_and_forget_launched(self):
+        self.cluster.record_launched(
+            [(instance("i-1"), "leader1"), (instance("i-2"), "worker1")]
+        )
+        self.assertEqual(
+            self.cluster.read_journal(),
+            {
+                "leader1": {"InstanceId": "i-1", "InstanceType": "m5d.large"},
+                "worker1": {"InstanceId": "i-2", "InstanceType": "m5d.large"},
+            },
+        )
+        self.cluster.forget_launched(["leader1", "worker9"])
+        self.assertEqual(list(self.cluster.read_journal()), ["worker1"])
+
+    def test_match_nodes(self):
+        self.cluster.record_launched([(instance("i-1"), "leader1")])
+        nodes = self.config.nodes()
+        active = [
+            instance("i-1"),
+            instance("i-2", name="mycluster-worker1"),
+            instance("i-3", name="mycluster-worker9"),
+            instance("i-4", name="othercluster-worker2"),
+        ]
+        self.assertEqual(
+            self.cluster.match_nodes(nodes, active),
+            {"i-1": "leader1", "i-2": "worker1"},
+        )
+
+    def test_resume_after_partial_failure(self):
+        # the previous launch only launched leader1 and worker1
+        self.cluster.record_launched(
+            [(instance("i-1"), "leader1"), (instance("i-2"), "worker1")]
+        )
+        active = [instance("i-1", "pending"), instance("i-2")]
+        nodes = self.config.nodes()
+        instance_d = self.cluster.launch_missing(nodes, "sg-1", active)
+
+        self.assertEqual(
+            self.launched, ["leader2", "worker2", "worker3", "worker4"]
+        )
+        self.assertEqual(instance_d["i-1"], "leader1")
+        self.assertEqual(instance_d["i-2"], "worker1")
+        self.assertEqual(sorted(instance_d.values()), sorted(nodes))
+        # adopted instances are tagged with their hostname again
+        self.assertEqual(
+            self.cluster.ec2.tags["i-2"],
+            [{"Key": "Name", "Value": "mycluster-worker1"}],
+        )
+        self.assertEqual(sorted(self.cluster.read_journal()), sorted(nodes))
+
+    def test_adopted_instance_not_running(self):
+        self.cluster.record_launched([(instance("i-1"), "leader1")])
+        active = [instance("i-1", "stopped")]
+        with self.assertRaises(SystemExit):
+            self.cluster.launch_missing(self.config.nodes(), "sg-1", active)
+        self.assertEqual(self.launched, [])
+
+    def test_terminated_journal_entry(self):
+        # the instance recorded for worker1 was terminated since, so
+        # worker1 is launched again and the journal points to the new one
+        self.cluster.record_launched([(instance("i-gone"), "worker1")])
+        nodes = {"worker1": self.config.nodes()["worker1"]}
+        instance_d = self.cluster.launch_missing(nodes, "sg-1", [])
+
+        self.assertEqual(self.launched, ["worker1"])
+        self.assertEqual(instance_d, {"i-new-worker1": "worker1"})
+        self.assertEqual(
+            self.cluster.read_journal()["worker1"]["InstanceId"],
+            "i-new-worker1",
+        )
+
+    def test_launch_rejects_unknown_instance(self):
+        # an instance with the cluster tag that was not launched for any
+        # node of the cluster is not adopted
+        self.cluster.ec2.instances = [
+            instance("i-1", name="mycluster-worker1"),
+            instance("i-2", name="mycluster-other"),
+            instance("i-3", "terminated", name="mycluster-worker2"),
+        ]
+        self.cluster.update_instance_types = self.stop_launch
+        with self.assertRaises(SystemExit) as cm:
+            self.cluster.launch()
+        self.assertIn("i-2", str(cm.exception))
+        self.assertNotIn("i-1", str(cm.exception))
+
+    def test_launch_accepts_journal_instances(self):
+        self.cluster.record_launched([(instance("i-1"), "leader1")])
+        self.cluster.ec2.instances = [
+            instance("i-1"),
+            instance("i-2", "stopped", name="mycluster-worker1"),
+            instance("i-3", "terminated", name="mycluster-other"),
+        ]
+        self.cluster.update_instance_types = self.stop_launch
+        with self.assertRaises(LaunchStopped):
+            self.cluster.launch()
+
+    @staticmethod
+    def stop_launch():
+        raise LaunchStopped()
+
+
+class FakeRunInstances(FakeEc2):
+    # fails run_instances with the error code given for the instance type
+    # and subnet of the request, and launches at most `capacity` instances
+    def __init__(self, errors, capacity=None):
+        FakeEc2.__init__(self)
+        self.errors = errors
+        self.capacity = capacity
+        self.requests = []
+
+    def run_instances(self, **request):
+        instance_type = request["InstanceType"]
+        subnet_id = request["NetworkInterfaces"][0]["SubnetId"]
+        self.requests.append((instance_type, subnet_id))
+        code = self.errors.get((instance_type, subnet_id))
+        if code is not None:
+            raise ClientError(
+                {"Error": {"Code": code, "Message": code}}, "RunInstances"
+            )
+        count = min(request["MaxCount"], self.capacity or request["MaxCount"])
+        return {
+            "Instances": [
+                dict(
+                    instance("i-{0}-{1}".format(len(self.requests), n)),
+                    InstanceType=instance_type,
+                    AmiLaunchIndex=n,
+                )
+                for n in range(count)
+            ]
+        }
+
+
+class Ec2ClusterLaunchGroupTest(TestCase):
+    REQUEST = {
+        "ImageId": "ami-1",
+        "InstanceType": "m5d.large",
+        "NetworkInterfaces": [{"DeviceIndex": 0, "SubnetId": "subnet-a"}],
+    }
+
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.config = Ec2DeployConfig(
+            "muchos",
+            "../conf/muchos.props.example",
+            "../conf/hosts/example/example_cluster",
+            "../conf/checksums",
+            "../conf/templates",
+            "mycluster",
+        )
+        self.config.deploy_path = self.tmp_dir.name
+        self.config.set("ec2", "worker_fallback_instance_types", "m5d.xlarge")
+        self.config.set("ec2", "fallback_subnet_ids", "subnet-b")
+        self.cluster = Ec2Cluster(self.config)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def launch_group(self, ec2, hostnames):
+        self.cluster._ec2 = ec2
+        return self.cluster.launch_group(self.REQUEST, hostnames, "worker")
+
+    def test_fallback_instance_type(self):
+        ec2 = FakeRunInstances(
+            {("m5d.large", "subnet-a"): "InsufficientInstanceCapacity"}
+        )
+        launched = self.launch_group(ec2, ["worker1", "worker2"])
+        self.assertEqual(
+            ec2.requests,
+            [("m5d.large", "subnet-a"), ("m5d.xlarge", "subnet-a")],
+        )
+        self.assertEqual([h for _, h in launched], ["worker1", "worker2"])
+        self.assertEqual(
+            self.cluster.read_journal()["worker2"]["InstanceType"],
+            "m5d.xlarge",
+        )
+
+    def test_fallback_subnet(self):
+        ec2 = FakeRunInstances(
+            {
+                ("m5d.large", "subnet-a"): "InsufficientInstanceCapacity",
+                ("m5d.xlarge", "subnet-a"): "InsufficientInstanceCapacity",
+            }
+        )
+        launched = self.launch_group(ec2, ["worker1"])
+        self.assertEqual(ec2.requests[-1], ("m5d.large", "subnet-b"))
+        self.assertEqual([h for _, h in launched], ["worker1"])
+
+    def test_partial_capacity(self):
+        # nodes that did not fit are launched using the next fallback
+        ec2 = FakeRunInstances({}, capacity=1)
+        launched = self.launch_group(ec2, ["worker1", "worker2"])
+        self.assertEqual(
+            ec2.requests,
+            [("m5d.large", "subnet-a"), ("m5d.xlarge", "subnet-a")],
+        )
+        self.assertEqual([h for _, h in launched], ["worker1", "worker2"])
+
+    def test_other_errors_fail(self):
+        ec2 = FakeRunInstances(
+            {("m5d.large", "subnet-a"): "InvalidParameterValue"}
+        )
+        with self.assertRaises(ClientError) as cm:
+            self.launch_group(ec2, ["worker1"])
+        self.assertEqual(
+            cm.exception.response["Error"]["Code"], "InvalidParameterValue"
+        )
+        self.assertEqual(ec2.requests, [("m5d.large", "subnet-a")])
+
+    def test_no_capacity_anywhere(self):
+        ec2 = FakeRunInstances(
+            {
+                (instance_type, subnet_id): "InsufficientInstanceCapacity"
+                for instance_type in ("m5d.large", "m5d.xlarge")
+                for subnet_id in ("subnet-a", "subnet-b")
+            }
+        )
+        with self.assertRaises(ClientError):
+            self.launch_group(ec2, ["worker1"])
+        self.assertEqual(len(ec2.requests), 4)
+
+
+class FakeDescribeImages(FakeEc2):
+    def __init__(self, architecture):
+        FakeEc2.__init__(self)
+        self.architecture = architecture
+
+    def describe_images(self, ImageIds):
+        return {
+            "Images": [
+                {"ImageId": ImageIds[0], "Architecture": self.architecture}
+            ]
+        }
+
+
+class Ec2ClusterArchitectureTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.config = Ec2DeployConfig(
+            "muchos",
+            "../conf/muchos.props.example",
+            "../conf/hosts/example/example_cluster",
+            "../conf/checksums",
+            "../conf/templates",
+            "mycluster",
+        )
+        self.config.deploy_path = self.tmp_dir.name
+        self.config.set("general", "use_baked_image", "False")
+        self.cluster = Ec2Cluster(self.config)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_x86_64_image(self):
+        self.cluster._ec2 = FakeDescribeImages("x86_64")
+        self.cluster.verify_architecture(["m5d.large", "i4i.large"])
+        with self.assertRaises(SystemExit) as cm:
+            self.cluster.verify_architecture(["m5d.large", "c6gd.large"])
+        self.assertIn("c6gd.large", str(cm.exception))
+
+    def test_arm64_image(self):
+        self.cluster._ec2 = FakeDescribeImages("arm64")
+        self.cluster.verify_architecture(["c6gd.large"])
+        with self.assertRaises(SystemExit):
+            self.cluster.verify_architecture(["m5d.large"])
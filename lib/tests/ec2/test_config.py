@@ -15,7 +15,10 @@
 # limitations under the License.
 #
 
+from unittest import TestCase
+
 from muchos.config.ec2 import Ec2DeployConfig
+from muchos.ec2types import EC2Type
 
 
 def test_ec2_cluster():
@@ -53,10 +56,12 @@ def test_ec2_cluster():
         "default": {
             "mounts": ["/media/ephemeral0"],
             "devices": ["/dev/nvme1n1"],
+            "ebs_devices": [],
         },
         "worker": {
             "mounts": ["/media/ephemeral0"],
             "devices": ["/dev/nvme1n1"],
+            "ebs_devices": [],
         },
     }
     assert c.node_type("worker1") == "worker"
@@ -168,3 +173,222 @@ def test_ec2_cluster_template():
     assert "worker" in c.cluster_template_d
     assert "zookeeper" in c.cluster_template_d
     assert "devices" in c.cluster_template_d
+
+
+def test_ec2_fleet():
+    c = Ec2DeployConfig(
+        "muchos",
+        "../conf/muchos.props.example",
+        "../conf/hosts/example/example_cluster",
+        "../conf/checksums",
+        "../conf/templates",
+        "mycluster",
+    )
+    assert c.worker_launch_mode() == "instances"
+    assert c.fleet_instance_types() == ["m5d.large"]
+    assert c.fleet_on_demand_percentage() == 0
+
+    c.set("ec2", "worker_launch_mode", "fleet")
+    c.set("ec2", "fleet_instance_types", "m5d.large, m5d.xlarge")
+    c.set("ec2", "fleet_on_demand_percentage", "25")
+    assert c.worker_launch_mode() == "fleet"
+    assert c.fleet_instance_types() == ["m5d.large", "m5d.xlarge"]
+    assert c.fleet_on_demand_percentage() == 25
+    c.verify_launch()
+
+
+def test_ec2_placement():
+    c = Ec2DeployConfig(
+        "muchos",
+        "../conf/muchos.props.example",
+        "../conf/hosts/example/example_cluster",
+        "../conf/checksums",
+        "../conf/templates",
+        "mycluster",
+    )
+    assert c.placement_strategy() is None
+    assert c.subnet_ids() == []
+
+    c.set("ec2", "subnet_id", "subnet-a")
+    assert c.subnet_ids() == ["subnet-a"]
+    c.set("ec2", "subnet_ids", "subnet-a, subnet-b")
+    assert c.subnet_ids() == ["subnet-a", "subnet-b"]
+
+    c.set("ec2", "placement_strategy", "partition")
+    c.set("ec2", "placement_partitions", "5")
+    assert c.placement_strategy() == "partition"
+    assert c.placement_partitions() == 5
+    assert c.placement_group_name() == "mycluster-placement"
+    c.verify_launch()
+
+    c.set("ec2", "placement_strategy", "cluster")
+    with TestCase().assertRaises(SystemExit):
+        c.verify_launch()
+
+
+def test_ec2_fallbacks():
+    c = Ec2DeployConfig(
+        "muchos",
+        "../conf/muchos.props.example",
+        "../conf/hosts/example/example_cluster",
+        "../conf/checksums",
+        "../conf/templates",
+        "mycluster",
+    )
+    assert c.fallback_instance_types("worker") == []
+    assert c.fallback_subnet_ids() == []
+
+    c.set("ec2", "worker_fallback_instance_types", "m5d.xlarge, m6id.xlarge")
+    c.set("ec2", "fallback_subnet_ids", "subnet-b")
+    assert c.fallback_instance_types("worker") == ["m5d.xlarge", "m6id.xlarge"]
+    assert c.fallback_instance_types("default") == []
+    assert c.fallback_subnet_ids() == ["subnet-b"]
+    assert "m6id.xlarge" in c.launch_instance_types()
+    c.verify_launch()
+
+    # fallback instance types must have the same devices
+    c.set("ec2", "default_fallback_instance_types", "m5d.4xlarge")
+    with TestCase().assertRaises(SystemExit):
+        c.verify_launch()
+
+
+def test_ec2_baked_image():
+    c = Ec2DeployConfig(
+        "muchos",
+        "../conf/muchos.props.example",
+        "../conf/hosts/example/example_cluster",
+        "../conf/checksums",
+        "../conf/templates",
+        "mycluster",
+    )
+    assert c.use_baked_image()
+    key = c.image_key()
+    assert c.baked_image_name() == "muchos-" + key
+    assert c.ansible_play_vars()["image_key"] == key
+
+    # images are baked for a base image and software versions
+    aws_ami = c.base_image()
+    c.set("ec2", "aws_ami", "ami-other")
+    assert c.image_key() != key
+    c.set("ec2", "aws_ami", aws_ami)
+    assert c.image_key() == key
+    c.set("general", "java_package", "java-17-openjdk-devel")
+    assert c.image_key() != key
+
+
+def test_ec2_hibernation():
+    c = Ec2DeployConfig(
+        "muchos",
+        "../conf/muchos.props.example",
+        "../conf/hosts/example/example_cluster",
+        "../conf/checksums",
+        "../conf/templates",
+        "mycluster",
+    )
+    assert not c.hibernate()
+    c.set("ec2", "hibernate", "true")
+    assert c.hibernate()
+
+    # support for hibernation is only known once looked up from EC2
+    with TestCase().assertRaises(SystemExit):
+        c.verify_launch()
+    c.instance_types.types["m5d.large"] = EC2Type(
+        "hvm", 1, True, "nitro", memory_mib=8192, hibernation_supported=True
+    )
+    c.verify_launch()
+
+    c.set("ec2", "worker_launch_mode", "fleet")
+    with TestCase().assertRaises(SystemExit):
+        c.verify_launch()
+
+
+def test_ec2_ebs_volumes():
+    c = Ec2DeployConfig(
+        "muchos",
+        "../conf/muchos.props.example",
+        "../conf/hosts/example/example_cluster",
+        "../conf/checksums",
+        "../conf/templates",
+        "mycluster",
+    )
+    assert c.ebs_volumes("worker") == 0
+    assert c.ebs_block_device_map("worker") == []
+
+    c.set("ec2", "worker_ebs_volumes", "2")
+    c.set("ec2", "worker_ebs_volume_size", "1000")
+    c.set("ec2", "worker_ebs_volume_throughput", "250")
+    assert c.ebs_volume_type("worker") == "gp3"
+    assert c.node_type_map()["worker"] == {
+        "mounts": [
+            "/media/ephemeral0",
+            "/media/ephemeral1",
+            "/media/ephemeral2",
+        ],
+        "devices": ["/dev/nvme1n1"],
+        "ebs_devices": ["/dev/xvdf", "/dev/xvdg"],
+    }
+    assert c.max_ephemeral() == 3
+    assert c.ebs_block_device_map("worker")[1] == {
+        "DeviceName": "/dev/sdg",
+        "Ebs": {
+            "DeleteOnTermination": True,
+            "VolumeSize": 1000,
+            "VolumeType": "gp3",
+            "Throughput": 250,
+        },
+    }
+    c.verify_launch()
+
+    # EBS-only instance types can be used for nodes with EBS volumes
+    c.instance_types.types["c5.large"] = EC2Type("hvm", 0, False, "nitro")
+    c.set("ec2", "worker_instance_type", "c5.large")
+    assert c.worker_data_dirs() == ["/media/ephemeral0", "/media/ephemeral1"]
+    c.verify_launch()
+    c.set("ec2", "default_instance_type", "c5.large")
+    with TestCase().assertRaises(SystemExit):
+        c.verify_launch()
+    c.set("ec2", "default_instance_type", "m5d.large")
+
+    # io2 volumes require provisioned IOPS, and have no throughput setting
+    c.set("ec2", "worker_ebs_volume_type", "io2")
+    with TestCase().assertRaises(SystemExit):
+        c.verify_launch()
+    c.set("ec2", "worker_ebs_volume_iops", "16000")
+    with TestCase().assertRaises(SystemExit):
+        c.verify_launch()
+    c.remove_option("ec2", "worker_ebs_volume_throughput")
+    c.verify_launch()
+
+
+def test_ec2_striped_layout():
+    c = Ec2DeployConfig(
+        "muchos",
+        "../conf/muchos.props.example",
+        "../conf/hosts/example/example_cluster",
+        "../conf/checksums",
+        "../conf/templates",
+        "mycluster",
+    )
+    assert c.data_layout("worker") == "jbod"
+    assert c.stripe_chunk_kb() == 256
+
+    # a single device is not striped
+    c.set("general", "worker_data_layout", "striped")
+    assert "layout" not in c.node_type_map()["worker"]
+
+    c.set("ec2", "worker_instance_type", "i3en.2xlarge")
+    c.set("ec2", "worker_ebs_volumes", "1")
+    c.set("general", "stripe_chunk_kb", "512")
+    assert c.node_type_map()["worker"] == {
+        "mounts": ["/media/ephemeral0"],
+        "devices": ["/dev/nvme1n1", "/dev/nvme2n1"],
+        "ebs_devices": ["/dev/xvdf"],
+        "layout": "striped",
+    }
+    assert c.worker_data_dirs() == ["/media/ephemeral0"]
+    assert c.max_ephemeral() == 1
+    assert c.ansible_play_vars()["stripe_chunk_kb"] == 512
+
+    c.set("general", "worker_data_layout", "jbod")
+    assert len(c.worker_data_dirs()) == 3
+    assert c.max_ephemeral() == 3
@@ -0,0 +1,66 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from os import makedirs, path
+from tempfile import TemporaryDirectory
+
+from muchos.config.existing import ExistingDeployConfig
+from muchos.existing import ExistingCluster
+
+INVENTORY = """[proxy]
+leader1
+
+[workers]
+worker1
+worker2
+worker3
+worker5
+
+[new_workers]
+
+[removed_workers]
+"""
+
+
+def test_worker_changes():
+    c = ExistingDeployConfig(
+        "muchos",
+        "../conf/muchos.props.example",
+        "../conf/hosts/example/example_cluster",
+        "../conf/checksums",
+        "../conf/templates",
+        "mycluster",
+    )
+    with TemporaryDirectory() as tmp_dir:
+        c.deploy_path = tmp_dir
+        makedirs(path.join(tmp_dir, "ansible/conf"))
+        with open(path.join(tmp_dir, "ansible/conf/hosts"), "w") as f:
+            f.write(INVENTORY)
+        cluster = ExistingCluster(c)
+        assert cluster.inventory_group("proxy") == ["leader1"]
+        assert cluster.inventory_group("new_workers") == []
+        assert cluster.worker_changes() == (["worker4"], ["worker5"])
+
+        # an interrupted grow is repeated
+        inventory = INVENTORY.replace(
+            "[new_workers]", "[new_workers]\nworker3"
+        )
+        with open(path.join(tmp_dir, "ansible/conf/hosts"), "w") as f:
+            f.write(inventory)
+        new_workers, removed_workers = cluster.worker_changes()
+        assert new_workers == ["worker3", "worker4"]
+        assert removed_workers == ["worker5"]
@@ -0,0 +1,48 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import time
+from datetime import datetime
+from tempfile import TemporaryDirectory
+from os import path
+
+from muchos.cache import FileCache
+
+
+def test_file_cache():
+    with TemporaryDirectory() as tmp_dir:
+        cache = FileCache(path.join(tmp_dir, "cache"))
+        assert cache.get("inventory-mycluster", 60) is None
+
+        nodes = [{"InstanceId": "i-1", "LaunchTime": datetime(2020, 1, 1)}]
+        cache.put("inventory-mycluster", nodes)
+        assert cache.get("inventory-mycluster", 60) == [
+            {"InstanceId": "i-1", "LaunchTime": "2020-01-01 00:00:00"}
+        ]
+        assert cache.get("inventory-mycluster", None) is not None
+        assert cache.get("inventory-othercluster", 60) is None
+
+        time.sleep(0.01)
+        assert cache.get("inventory-mycluster", 0) is None
+
+        cache.invalidate("inventory-mycluster")
+        cache.invalidate("inventory-mycluster")
+        assert cache.get("inventory-mycluster", 60) is None
+
+        with open(cache.path("corrupt"), "w") as cache_file:
+            cache_file.write("{")
+        assert cache.get("corrupt", 60) is None
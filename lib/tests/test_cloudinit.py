@@ -0,0 +1,56 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+from email import message_from_string
+
+from muchos.cloudinit import cloud_config, combine
+
+
+def test_cloud_config():
+    text = cloud_config(
+        ["/dev/nvme1n1", "/dev/nvme2n1"],
+        ["/media/ephemeral0", "/media/ephemeral1"],
+        "ext4",
+        "no",
+        "centos:centos",
+        ["git"],
+    )
+    assert text.startswith("#cloud-config\n")
+    config = json.loads(text.split("\n", 1)[1])
+    assert [fs["device"] for fs in config["fs_setup"]] == [
+        "/dev/nvme1n1",
+        "/dev/nvme2n1",
+    ]
+    assert not config["fs_setup"][0]["overwrite"]
+    assert config["mounts"][1][:2] == ["/dev/nvme2n1", "/media/ephemeral1"]
+    assert config["packages"] == ["git"]
+    assert ["chown", "centos:centos", "/media/ephemeral0"] in config["runcmd"]
+
+
+def test_combine():
+    text = cloud_config([], [], "ext4", "yes", "centos:centos", [])
+    assert combine(text) == text
+
+    message = message_from_string(combine(text, "#!/bin/bash\necho hi\n"))
+    assert message.is_multipart()
+    parts = message.get_payload()
+    assert [part.get_content_type() for part in parts] == [
+        "text/cloud-config",
+        "text/x-shellscript",
+    ]
+    assert parts[1].get_payload() == "#!/bin/bash\necho hi\n"
@@ -0,0 +1,127 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from muchos.cache import FileCache
+from muchos.ec2types import EC2Type, InstanceTypeCatalog
+from muchos.util import get_block_device_map, get_ephemeral_devices
+
+C7GD_LARGE = {
+    "InstanceType": "c7gd.large",
+    "SupportedVirtualizationTypes": ["hvm"],
+    "Hypervisor": "nitro",
+    "VCpuInfo": {"DefaultVCpus": 2},
+    "MemoryInfo": {"SizeInMiB": 4096},
+    "InstanceStorageSupported": True,
+    "InstanceStorageInfo": {
+        "TotalSizeInGB": 118,
+        "Disks": [{"SizeInGB": 118, "Count": 1, "Type": "ssd"}],
+        "NvmeSupport": "required",
+    },
+    "NetworkInfo": {"NetworkPerformance": "Up to 10 Gigabit"},
+    "HibernationSupported": True,
+    "ProcessorInfo": {"SupportedArchitectures": ["arm64"]},
+}
+
+C5_LARGE = {
+    "InstanceType": "c5.large",
+    "SupportedVirtualizationTypes": ["hvm"],
+    "Hypervisor": "nitro",
+    "VCpuInfo": {"DefaultVCpus": 2},
+    "MemoryInfo": {"SizeInMiB": 4096},
+    "InstanceStorageSupported": False,
+    "NetworkInfo": {"NetworkPerformance": "Up to 10 Gigabit"},
+    "ProcessorInfo": {"SupportedArchitectures": ["x86_64"]},
+}
+
+
+class FakePaginator(object):
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, **kwargs):
+        return self.pages
+
+
+class FakeEc2(object):
+    def get_paginator(self, name):
+        return FakePaginator([{"InstanceTypes": [C7GD_LARGE, C5_LARGE]}])
+
+
+class InstanceTypeCatalogTest(TestCase):
+    def test_from_description(self):
+        ec2_type = EC2Type.from_description(C7GD_LARGE)
+        self.assertEqual(ec2_type.arch, "hvm")
+        self.assertEqual(ec2_type.ephemeral, 1)
+        self.assertTrue(ec2_type.has_nvme)
+        self.assertEqual(ec2_type.nvme_start, 1)
+        self.assertEqual(ec2_type.vcpus, 2)
+        self.assertEqual(ec2_type.memory_mib, 4096)
+        self.assertEqual(ec2_type.disk_size_gb, 118)
+        self.assertEqual(ec2_type.network_performance, "Up to 10 Gigabit")
+        self.assertTrue(ec2_type.hibernation_supported)
+        self.assertEqual(ec2_type.architectures, ["arm64"])
+
+        ec2_type = EC2Type.from_description(C5_LARGE)
+        self.assertEqual(ec2_type.ephemeral, 0)
+        self.assertFalse(ec2_type.has_nvme)
+        self.assertFalse(ec2_type.hibernation_supported)
+        self.assertEqual(ec2_type.architectures, ["x86_64"])
+
+    def test_refresh(self):
+        with TemporaryDirectory() as tmp_dir:
+            catalog = InstanceTypeCatalog(FileCache(tmp_dir))
+            self.assertNotIn("c7gd.large", catalog)
+            self.assertIn("m5d.large", catalog)
+            self.assertEqual(
+                catalog.get("c6gd.large").architectures, ["arm64"]
+            )
+            self.assertEqual(
+                catalog.get("m5d.large").architectures, ["x86_64"]
+            )
+
+            catalog.refresh(FakeEc2(), ["c7gd.large", "c5.large"])
+            self.assertEqual(
+                get_ephemeral_devices("c7gd.large", catalog),
+                ["/dev/nvme1n1"],
+            )
+            self.assertEqual(
+                get_block_device_map("c7gd.large", catalog),
+                [
+                    {
+                        "DeviceName": "/dev/sda1",
+                        "Ebs": {"DeleteOnTermination": True},
+                    }
+                ],
+            )
+            # EBS-only instance types are rejected,
+            with self.assertRaises(SystemExit):
+                get_ephemeral_devices("c5.large", catalog)
+            # unless EBS data volumes are attached to their nodes
+            self.assertEqual(
+                get_ephemeral_devices("c5.large", catalog, True), []
+            )
+
+            # types looked up from EC2 are loaded from the cache
+            catalog = InstanceTypeCatalog(FileCache(tmp_dir))
+            self.assertIn("c7gd.large", catalog)
+            self.assertEqual(catalog.get("c7gd.large").vcpus, 2)
+            self.assertEqual(
+                catalog.get("c7gd.large").architectures, ["arm64"]
+            )
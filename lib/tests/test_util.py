@@ -29,6 +29,13 @@ def test_util():
         ["/dev/nvme0n1", "/dev/nvme1n1"]
     )
 
+    assert get_ephemeral_devices("m5d.large") == ["/dev/nvme1n1"]
+    assert get_ephemeral_devices("i3en.2xlarge") == [
+        "/dev/nvme1n1",
+        "/dev/nvme2n1",
+    ]
+    assert len(get_ephemeral_devices("r6id.32xlarge")) == 4
+
     assert get_arch("m1.large") == "pvm"
     assert get_arch("m3.large") == "hvm"
 